@@ -0,0 +1,239 @@
+# 📁 answer_cache.py
+
+# 👉 Answer cache for ComplianceRAG (exact + near-duplicate questions)
+
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import threading
+import hashlib
+import sqlite3
+import json
+import time
+import re
+
+def normalize_question(question):
+    """Case, whitespace and trailing punctuation don't change the answer"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+def cache_scope(model_name, concise, index_version, retrieval="vector"):
+    # Answers are only reusable for the same model, retrieval + prompt mode and index
+    return f"{model_name}|{retrieval}|{'concise' if concise else 'full'}|{index_version}"
+
+class AnswerCache:
+    """
+    LRU + TTL cache of generated answers
+
+    Lookups are exact on the normalized question first; on a miss the
+    question embedding is compared (cosine) against cached questions in the
+    same scope and anything above similarity_threshold counts as a hit.
+
+    With db_path set, entries are written through to SQLite and reloaded
+    on startup, so the cache survives restarts.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=24 * 3600,
+                 similarity_threshold=0.95, db_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._entries = OrderedDict()  # key → entry, least recently used first
+        self._lock = threading.Lock()
+        self._matrix = {}              # scope → (keys, normalized embeddings)
+
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+        self.db_path = db_path
+        self._db = None
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    scope TEXT,
+                    question TEXT,
+                    answer TEXT,
+                    sources TEXT,
+                    embedding BLOB,
+                    created REAL,
+                    last_used REAL
+                )"""
+            )
+            self._db.commit()
+            self._load()
+
+    def reopen(self):
+        """New SQLite connection - for forked workers (a connection must not cross fork())"""
+        if self.db_path:
+            with self._lock:
+                self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+
+    @staticmethod
+    def make_key(question, scope):
+        text = f"{scope}\n{normalize_question(question)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    # 🔹 Lookups
+    def get(self, question, scope):
+        """Exact match on the normalized question"""
+        with self._lock:
+            entry = self._touch(self.make_key(question, scope))
+            if entry is not None:
+                self.stats["hits"] += 1
+            return entry
+
+    def get_similar(self, question, scope, embedding):
+        """Exact match, then nearest cached question by embedding similarity"""
+        with self._lock:
+            entry = self._touch(self.make_key(question, scope))
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry
+
+            keys, matrix = self._scope_matrix(scope)
+            if keys:
+                query = np.asarray(embedding, dtype=np.float32)
+                query = query / (np.linalg.norm(query) or 1.0)
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    entry = self._touch(keys[best])
+                    if entry is not None:
+                        self.stats["semantic_hits"] += 1
+                        return entry
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, question, scope, answer, sources=None, embedding=None):
+        now = time.time()
+        key = self.make_key(question, scope)
+        entry = {
+            "key": key,
+            "scope": scope,
+            "question": question,
+            "answer": answer,
+            "sources": sources or [],
+            "embedding": None if embedding is None else np.asarray(embedding, dtype=np.float32),
+            "created": now,
+            "last_used": now,
+        }
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._matrix.pop(scope, None)
+            self._write(entry)
+
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+
+    # 🔹 Invalidation
+    def invalidate(self, keep_index_version=None):
+        """
+        Drop entries built against any other index version
+        (or everything when keep_index_version is None)
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if keep_index_version is None or not entry["scope"].endswith(f"|{keep_index_version}"):
+                    del self._entries[key]
+            self._matrix.clear()
+
+            if self._db is not None:
+                if keep_index_version is None:
+                    self._db.execute("DELETE FROM answers")
+                else:
+                    self._db.execute(
+                        "DELETE FROM answers WHERE scope NOT LIKE ?",
+                        (f"%|{keep_index_version}",)
+                    )
+                self._db.commit()
+
+    def clear(self):
+        self.invalidate(None)
+
+    # 🔹 Internals (call with the lock held)
+    def _touch(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        now = time.time()
+        if now - entry["created"] > self.ttl_seconds:
+            del self._entries[key]
+            self._forget(key)
+            return None
+
+        entry["last_used"] = now
+        self._entries.move_to_end(key)
+        return entry
+
+    def _scope_matrix(self, scope):
+        if scope not in self._matrix:
+            items = [
+                (key, e["embedding"]) for key, e in self._entries.items()
+                if e["scope"] == scope and e["embedding"] is not None
+            ]
+            keys = [key for key, _ in items]
+            if items:
+                matrix = np.stack([emb for _, emb in items])
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            self._matrix[scope] = (keys, matrix)
+        return self._matrix[scope]
+
+    def _forget(self, key):
+        self._matrix.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _write(self, entry):
+        if self._db is None:
+            return
+        embedding = entry["embedding"]
+        self._db.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry["key"], entry["scope"], entry["question"], entry["answer"],
+                json.dumps(entry["sources"]),
+                None if embedding is None else embedding.tobytes(),
+                entry["created"], entry["last_used"],
+            )
+        )
+        self._db.commit()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl_seconds
+        self._db.execute("DELETE FROM answers WHERE created < ?", (cutoff,))
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT key, scope, question, answer, sources, embedding, created, last_used "
+            "FROM answers ORDER BY last_used DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+
+        # Rows that didn't fit would never be evicted otherwise
+        if len(rows) == self.max_entries:
+            self._db.execute("DELETE FROM answers WHERE last_used < ?", (rows[-1][7],))
+            self._db.commit()
+
+        # Oldest first so the most recently used end up at the LRU tail
+        for key, scope, question, answer, sources, embedding, created, last_used in reversed(rows):
+            self._entries[key] = {
+                "key": key,
+                "scope": scope,
+                "question": question,
+                "answer": answer,
+                "sources": json.loads(sources),
+                "embedding": None if embedding is None else np.frombuffer(embedding, dtype=np.float32),
+                "created": created,
+                "last_used": last_used,
+            }
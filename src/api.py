@@ -1,15 +1,26 @@
 # 📁 api.py - FastAPI REST API
 
-from fastapi import FastAPI, HTTPException
+# First import: starts the startup clock before anything heavy
+from lazy_models import (
+    lazy_rag, lazy_ner, startup_profile, warmup_targets, warm_up_in_background, process_memory
+)
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional
 import uvicorn
+import asyncio
+import json
+import time
 from pathlib import Path
 import os
 
-from rag_chain import ComplianceRAG
-from ner_infer import FinancialNER
+from micro_batcher import MicroBatcher
+from llm_gateway import LLMUnavailable
+from metrics import MetricsMiddleware, TRACES, record_stage, render_metrics, start_snapshot_writer
 
 # Change to project root
 script_dir = Path(__file__).parent
@@ -30,33 +41,98 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-ID"],
 )
 
-# Initialize models at startup
-rag = None
-ner = None
+# Latency histogram, in-flight gauge and a trace (X-Trace-ID) per request
+app.add_middleware(MetricsMiddleware)
+
+# Upper bound on texts accepted by /ner/batch in one request
+MAX_NER_BATCH_TEXTS = 10000
+# Upper bound on questions accepted by /ask/batch in one request
+MAX_ASK_BATCH_QUESTIONS = 100
+
+# Models are built on first use - the server accepts connections immediately
+# and $MODEL_WARMUP (default "rag,ner") loads them in the background meanwhile
+models = {"rag": lazy_rag(), "ner": lazy_ner()}
+
+# Concurrent /ner texts and /ask questions are coalesced into one forward pass:
+# a batch closes after $..._BATCH_WAIT_MS or $..._BATCH_SIZE requests
+batchers = {
+    "ner": MicroBatcher(
+        "ner_batcher",
+        lambda texts: models["ner"].get().extract_batch(texts, batch_size=len(texts)),
+        max_batch=int(os.getenv("NER_BATCH_SIZE", "32")),
+        max_wait_ms=float(os.getenv("NER_BATCH_WAIT_MS", "5"))
+    ),
+    # Query vectors for /ask: handed straight to the answer path (after the exact cache missed)
+    "embedding": MicroBatcher(
+        "embedding_batcher",
+        lambda questions: models["rag"].get().embed_queries(questions),
+        max_batch=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+        max_wait_ms=float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+    ),
+}
 
 @app.on_event("startup")
 async def startup_event():
-    global rag, ner
-    print("🚀 Initializing models...")
+    startup_profile.mark("app_ready")
+    start_snapshot_writer()  # Only under serve.py ($METRICS_DIR)
+    targets = warmup_targets()
+    print(f"🚀 API ready in {startup_profile.to_dict()['app_ready']:.2f}s"
+          + (f" - warming up {', '.join(targets)} in the background" if targets else ""))
+    if targets:
+        warm_up_in_background([models[name] for name in targets if name in models])
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for batcher in batchers.values():
+        await batcher.close()
+
+# LLM backpressure: 429 (queue full), 503 (no slot in time), 504 (generation too slow)
+@app.exception_handler(LLMUnavailable)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailable):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)}, headers=headers)
+
+async def get_model(name):
+    """The model, loading it now if needed (off the event loop) - 503 if it can't load"""
+    model = models[name]
+    if model.loaded:
+        return model.get()
+    start = time.perf_counter()
     try:
-        rag = ComplianceRAG()
-        ner = FinancialNER()
-        print("✅ Models loaded successfully")
+        return await run_in_threadpool(model.get)
     except Exception as e:
-        print(f"❌ Failed to load models: {e}")
-        raise
+        raise HTTPException(status_code=503, detail=f"{name.upper()} system not available: {e}")
+    finally:
+        # Requests that waited for the model show it in their trace
+        record_stage(name, "load", time.perf_counter() - start)
 
 # Request/Response models
 class QuestionRequest(BaseModel):
     question: str
     verbose: bool = False
 
+class Source(BaseModel):
+    text: str
+    score: Optional[float] = None
+    file_name: Optional[str] = None
+
 class QuestionResponse(BaseModel):
     question: str
     answer: str
     retrieved_docs: int
+    sources: List[Source] = []
+    timings: Dict[str, float] = {}
+    context: Dict[str, int] = {}
+
+class QuestionBatchRequest(BaseModel):
+    questions: List[str] = Field(..., max_length=MAX_ASK_BATCH_QUESTIONS)
+    concise: bool = False
+
+class QuestionBatchResponse(BaseModel):
+    results: List[QuestionResponse]
 
 class NERRequest(BaseModel):
     text: str
@@ -65,11 +141,20 @@ class Entity(BaseModel):
     text: str
     type: str
     tokens: List[str]
+    start: Optional[int] = None  # Character offsets in the request text
+    end: Optional[int] = None
 
 class NERResponse(BaseModel):
     text: str
     entities: List[Entity]
 
+class NERBatchRequest(BaseModel):
+    texts: List[str] = Field(..., max_length=MAX_NER_BATCH_TEXTS)
+    batch_size: int = Field(32, ge=1, le=256)
+
+class NERBatchResponse(BaseModel):
+    results: List[NERResponse]
+
 # Health check endpoint
 @app.get("/")
 def root():
@@ -79,7 +164,13 @@ def root():
         "endpoints": {
             "health": "/health",
             "ask": "/ask",
+            "ask_batch": "/ask/batch",
+            "ask_stream": "/ask/stream",
             "ner": "/ner",
+            "ner_batch": "/ner/batch",
+            "startup": "/startup",
+            "metrics": "/metrics",
+            "traces": "/traces",
             "docs": "/docs"
         }
     }
@@ -88,46 +179,150 @@ def root():
 def health_check():
     return {
         "status": "healthy",
-        "rag_loaded": rag is not None,
-        "ner_loaded": ner is not None
+        "rag_loaded": models["rag"].loaded,
+        "ner_loaded": models["ner"].loaded,
+        "llm": models["rag"].get().llm.stats() if models["rag"].loaded else None,
+        "models": {name: model.status() for name, model in models.items()},
+        "batchers": {name: dict(batcher.stats) for name, batcher in batchers.items()},
+        # One of several processes under serve.py - memory shows what this worker costs
+        "worker": {"pid": os.getpid(), **process_memory()}
     }
 
+@app.get("/startup")
+def startup_report():
+    """Startup profile: seconds per phase (imports, model loads, warm-up)"""
+    return startup_profile.to_dict()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_report():
+    """Prometheus text format - stage histograms, cache hits, in-flight gauges, tokens"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+def list_traces(limit: int = 20, name: Optional[str] = None):
+    """Slowest recent requests of this worker with their stage timings (e.g. name="POST /ask")"""
+    return {"traces": TRACES.slowest(limit=limit, name=name)}
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    found = TRACES.get(trace_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may be on another worker or expired)")
+    return found
+
+def to_question_response(question, result):
+    return QuestionResponse(
+        question=question,
+        answer=result.answer,
+        retrieved_docs=len(result.nodes),
+        sources=[
+            Source(
+                text=doc.text,
+                score=doc.score,
+                file_name=doc.metadata.get("file_name")
+            )
+            for doc in result.nodes
+        ],
+        timings=result.timings,
+        context=result.context
+    )
+
 # RAG endpoint
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(request: QuestionRequest):
     """
     Ask a compliance question using RAG
     """
-    if rag is None:
-        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    rag = await get_model("rag")
+    
+    try:
+        # Unless the exact answer is cached, embedded together with concurrent
+        # questions, then retrieval + generation
+        result = await rag.aanswer(
+            request.question,
+            verbose=request.verbose,
+            embedder=batchers["embedding"].submit
+        )
+        
+        return to_question_response(request.question, result)
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Bulk RAG endpoint
+@app.post("/ask/batch", response_model=QuestionBatchResponse)
+async def ask_questions_batch(request: QuestionBatchRequest):
+    """
+    Answer many questions - all questions are embedded in one model call
+    """
+    rag = await get_model("rag")
     
     try:
-        # Get retriever to count docs
-        retriever = rag.index.as_retriever(similarity_top_k=3)
-        docs = retriever.retrieve(request.question)
+        vectors = await run_in_threadpool(rag.embed_queries, request.questions)
+        embeddings = dict(zip(request.questions, vectors))
         
-        # Get answer
-        answer = rag.answer(request.question, verbose=request.verbose)
+        async def embedder(question):
+            return embeddings[question]
+        # One batch takes at most as many LLM slots as can run at once, so it
+        # waits its turn instead of overflowing the LLM queue
+        slots = asyncio.Semaphore(rag.llm.max_in_flight)
         
-        return QuestionResponse(
-            question=request.question,
-            answer=answer,
-            retrieved_docs=len(docs)
-        )
+        async def answer(question):
+            async with slots:
+                return await rag.aanswer(question, concise=request.concise, embedder=embedder)
+        
+        results = await asyncio.gather(*[answer(question) for question in request.questions])
+        
+        return QuestionBatchResponse(results=[
+            to_question_response(question, result)
+            for question, result in zip(request.questions, results)
+        ])
+    except LLMUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Streaming RAG endpoint (Server-Sent Events)
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Stream the answer as Server-Sent Events
+
+    Events: `sources` (retrieved chunks, sent first), `token` (one per
+    generated piece of text), then `done` with timings - or `error`.
+    """
+    rag = await get_model("rag")
+    
+    async def event_stream():
+        try:
+            async for event in rag.astream_answer(
+                request.question,
+                verbose=request.verbose,
+                embedder=batchers["embedding"].submit
+            ):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            error = {"type": "error", "message": str(e)}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # NER endpoint
 @app.post("/ner", response_model=NERResponse)
 async def extract_entities(request: NERRequest):
     """
     Extract financial entities from text
     """
-    if ner is None:
-        raise HTTPException(status_code=503, detail="NER system not initialized")
+    await get_model("ner")  # 503 if the model can't load
     
     try:
-        entities = ner.extract_grouped(request.text)
+        # Batched with concurrent /ner requests, off the event loop
+        entities = await batchers["ner"].submit(request.text)
         
         return NERResponse(
             text=request.text,
@@ -136,7 +331,29 @@ async def extract_entities(request: NERRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Run server
+# Batched NER endpoint
+@app.post("/ner/batch", response_model=NERBatchResponse)
+async def extract_entities_batch(request: NERBatchRequest):
+    """
+    Extract financial entities from many texts in batched forward passes
+    """
+    ner = await get_model("ner")
+    
+    try:
+        results = await run_in_threadpool(
+            ner.extract_batch, request.texts, request.batch_size
+        )
+        
+        return NERBatchResponse(
+            results=[
+                NERResponse(text=text, entities=[Entity(**e) for e in entities])
+                for text, entities in zip(request.texts, results)
+            ]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Run server (single process - see serve.py for multi-worker serving)
 if __name__ == "__main__":
     uvicorn.run(
         "api:app",
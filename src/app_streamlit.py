@@ -4,8 +4,8 @@ import streamlit as st
 from pathlib import Path
 import os
 
-from rag_chain import ComplianceRAG
-from ner_infer import FinancialNER
+# Models load on first use per tab (torch, llama_index, langchain imported then)
+from lazy_models import lazy_rag, lazy_ner, warmup_targets, warm_up_in_background
 
 # Change to project root
 script_dir = Path(__file__).parent
@@ -40,26 +40,31 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Initialize models
+# Lazy model handles, shared by every session ($MODEL_WARMUP=rag,ner warms them up in the background)
 @st.cache_resource
-def load_models():
-    with st.spinner("🔧 Loading AI models..."):
-        rag = ComplianceRAG()
-        ner = FinancialNER()
-    return rag, ner
+def get_models():
+    models = {"rag": lazy_rag(), "ner": lazy_ner()}
+    targets = warmup_targets(default="")
+    if targets:
+        warm_up_in_background([models[name] for name in targets if name in models])
+    return models
+
+def load_model(name):
+    """Build the model on first use - stops the page with an error if it can't load"""
+    model = get_models()[name]
+    try:
+        if model.loaded:
+            return model.get()
+        with st.spinner(f"🔧 Loading {name.upper()} model (first use)..."):
+            return model.get()
+    except Exception as e:
+        st.error(f"❌ Failed to load {name.upper()}: {e}")
+        st.stop()
 
 # Header
 st.markdown('<h1 class="main-header">💼 Financial Compliance Copilot</h1>', unsafe_allow_html=True)
 st.markdown("**AI-powered assistant for compliance queries and entity extraction**")
 
-# Load models
-try:
-    rag, ner = load_models()
-    st.success("✅ Models loaded successfully!")
-except Exception as e:
-    st.error(f"❌ Failed to load models: {e}")
-    st.stop()
-
 # Tabs
 tab1, tab2 = st.tabs(["📚 Ask Questions (RAG)", "🔍 Extract Entities (NER)"])
 
@@ -80,29 +85,34 @@ with tab1:
         verbose = st.checkbox("Show detailed retrieval info", value=False)
     
     if ask_button and question:
-        with st.spinner("🤔 Thinking..."):
-            try:
-                # Get retriever info
-                retriever = rag.index.as_retriever(similarity_top_k=3)
-                docs = retriever.retrieve(question)
-                
-                # Get answer
-                answer = rag.answer(question, verbose=verbose)
-                
-                # Display answer
-                st.markdown("### 🤖 Answer")
-                st.info(answer)
-                
-                # Show retrieved docs
-                if docs:
-                    with st.expander(f"📄 Retrieved {len(docs)} documents"):
-                        for i, doc in enumerate(docs, 1):
-                            st.markdown(f"**Document {i}** (score: {doc.score:.3f})")
-                            st.text(doc.text[:300] + "...")
-                            st.divider()
+        rag = load_model("rag")
+        try:
+            st.markdown("### 🤖 Answer")
+            answer_box = st.empty()
+            answer_box.info("🤔 Thinking...")
+            sources_box = st.container()
+            answer = ""
+            
+            # Tokens are rendered as they arrive; sources come first
+            for event in rag.stream_answer(question, verbose=verbose):
+                if event["type"] == "sources":
+                    docs = event["sources"]
+                    if docs:
+                        with sources_box.expander(f"📄 Retrieved {len(docs)} documents"):
+                            for i, doc in enumerate(docs, 1):
+                                st.markdown(f"**Document {i}** (score: {doc['score']:.3f})")
+                                st.text(doc["text"][:300] + "...")
+                                st.divider()
+                elif event["type"] == "token":
+                    answer += event["content"]
+                    answer_box.info(answer)
+                elif event["type"] == "error":
+                    st.error(event["message"])
+                elif event["type"] == "done":
+                    st.caption(f"⏱️ {event['timings']['total']:.2f}s")
                             
-            except Exception as e:
-                st.error(f"❌ Error: {e}")
+        except Exception as e:
+            st.error(f"❌ Error: {e}")
 
 # Tab 2: NER
 with tab2:
@@ -118,6 +128,7 @@ with tab2:
     extract_button = st.button("Extract Entities", type="primary", key="extract_btn")
     
     if extract_button and text:
+        ner = load_model("ner")
         with st.spinner("🔍 Extracting entities..."):
             try:
                 entities = ner.extract_grouped(text)
@@ -171,6 +182,9 @@ with st.sidebar:
     
     st.divider()
     
+    for name, model in get_models().items():
+        st.caption(f"{name.upper()}: {model.status().replace('_', ' ')}")
+    
     if st.button("🔄 Reload Models"):
         st.cache_resource.clear()
         st.rerun()
\ No newline at end of file
@@ -0,0 +1,345 @@
+# 📁 benchmark_retrieval.py
+
+# 👉 Measure how retrieval scales per storage backend on synthetic corpora
+
+from llama_index.core import VectorStoreIndex, QueryBundle
+from llama_index.core.schema import TextNode
+from pathlib import Path
+import multiprocessing as mp
+import argparse
+import platform
+import resource
+import json
+import time
+import os
+import numpy as np
+
+from create_sample_data import write_synthetic_corpus
+from ingest_index import build_storage_context
+from vector_store import configure_settings
+
+CORPUS_ROOT = Path("data/synthetic")
+BENCH_INDEX_ROOT = Path("indexes/bench")
+RESULTS_DIR = Path("benchmarks")
+
+# Benchmark name → (storage backend, FAISS index type)
+BACKENDS = {
+    "simple": ("simple", None),
+    "faiss-flat": ("faiss", "flat"),
+    "faiss-ivf": ("faiss", "ivf"),
+    "faiss-hnsw": ("faiss", "hnsw"),
+}
+
+# all-MiniLM-L6-v2 output size, used for --embedding random
+EMBED_DIM = 384
+
+# Metrics compared by --baseline and whether bigger is better
+REGRESSION_METRICS = {
+    "build_seconds": False,
+    "init_seconds": False,
+    "index_load_seconds": False,
+    "disk_bytes": False,
+    "rss_mb_loaded": False,
+    "latency_ms.p95": False,
+    "qps": True,
+    "recall_at_k": True,
+}
+
+# 🔹 Helpers
+def rss_mb():
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+def dir_size_bytes(path):
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file())
+
+def latency_summary_ms(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+    }
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+
+# 🔹 Corpus + embeddings
+def load_corpus(num_chunks):
+    corpus_dir = CORPUS_ROOT / str(num_chunks)
+    if not (corpus_dir / "queries.jsonl").exists():
+        write_synthetic_corpus(num_chunks, corpus_dir)
+
+    chunks = []
+    for shard in sorted(corpus_dir.glob("chunks-*.jsonl")):
+        with open(shard) as f:
+            chunks.extend(json.loads(line) for line in f)
+    with open(corpus_dir / "queries.jsonl") as f:
+        queries = [json.loads(line)["query"] for line in f]
+    return corpus_dir, chunks, queries
+
+def corpus_vectors(corpus_dir, chunks, embedding, embed_model=None, seed=42):
+    """
+    Chunk embeddings, cached next to the corpus so every backend (and every
+    later run) indexes exactly the same vectors
+
+    Returns (vectors, seconds spent embedding - 0.0 when served from cache)
+    """
+    cache_path = corpus_dir / f"embeddings-{embedding}.npy"
+    if cache_path.exists():
+        vectors = np.load(cache_path)
+        if len(vectors) == len(chunks):
+            return vectors, 0.0
+
+    start = time.perf_counter()
+    if embedding == "model":
+        texts = [chunk["text"] for chunk in chunks]
+        vectors = np.asarray(embed_model.get_text_embedding_batch(texts, show_progress=True), dtype="float32")
+    else:
+        rng = np.random.default_rng(seed)
+        vectors = normalize(rng.standard_normal((len(chunks), EMBED_DIM), dtype="float32"))
+    seconds = time.perf_counter() - start
+
+    np.save(cache_path, vectors)
+    return vectors, seconds
+
+def query_vectors(queries, vectors, embedding, embed_model=None, seed=7):
+    if embedding == "model":
+        return np.asarray(embed_model.get_text_embedding_batch(queries), dtype="float32")
+    # Random corpora have no meaningful text: query near existing vectors instead
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), size=len(queries))]
+    noise = rng.standard_normal(picks.shape, dtype="float32") * 0.05
+    return normalize(picks + noise).astype("float32")
+
+def exact_top_k(vectors, queries, k, block=256):
+    """Ground truth for recall@k: brute-force inner product over the corpus"""
+    truth = []
+    for start in range(0, len(queries), block):
+        scores = queries[start:start + block] @ vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        truth.extend(top.tolist())
+    return truth
+
+# 🔹 Build
+def build(storage, faiss_type, chunks, vectors, index_dir):
+    nodes = [
+        TextNode(
+            id_=chunk["id"],
+            text=chunk["text"],
+            metadata={"topic": chunk["topic"], "subject": chunk["subject"]},
+            embedding=vector.tolist()
+        )
+        for chunk, vector in zip(chunks, vectors)
+    ]
+
+    start = time.perf_counter()
+    storage_context = build_storage_context(storage, vectors, faiss_type or "flat")
+    index = VectorStoreIndex(nodes, storage_context=storage_context)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.storage_context.persist(persist_dir=str(index_dir))
+    persist_seconds = time.perf_counter() - start
+
+    return {
+        "build_seconds": build_seconds,
+        "persist_seconds": persist_seconds,
+        "disk_bytes": dir_size_bytes(index_dir),
+    }
+
+# 🔹 Load + query (runs in a fresh process so RSS and page cache state are per backend)
+def measure_serving(storage, index_dir, queries, vectors, truth, k, warmup):
+    baseline = rss_mb()
+
+    from rag_chain import ComplianceRAG
+
+    start = time.perf_counter()
+    rag = ComplianceRAG(storage=storage, index_dir=index_dir, cache=False)
+    init_seconds = time.perf_counter() - start
+    loaded = rss_mb()
+    # init_seconds includes the MiniLM load, which is the same for every backend
+    index_load_seconds = rag.startup_timings["index_load"]
+
+    retriever = rag.index.as_retriever(similarity_top_k=k)
+
+    def search(i):
+        bundle = QueryBundle(query_str=queries[i], embedding=vectors[i].tolist())
+        return retriever.retrieve(bundle)
+
+    for i in range(min(warmup, len(queries))):
+        search(i)
+
+    latencies = []
+    recalls = []
+    start = time.perf_counter()
+    for i in range(len(queries)):
+        t = time.perf_counter()
+        docs = search(i)
+        latencies.append(time.perf_counter() - t)
+        found = {doc.node.node_id for doc in docs}
+        recalls.append(len(found & set(truth[i])) / k)
+    total = time.perf_counter() - start
+
+    return {
+        "init_seconds": init_seconds,
+        "index_load_seconds": index_load_seconds,
+        "rss_mb_baseline": baseline,
+        "rss_mb_loaded": loaded,
+        "rss_mb_after_queries": rss_mb(),
+        "latency_ms": latency_summary_ms(latencies),
+        "qps": len(queries) / total if total > 0 else 0.0,
+        "recall_at_k": float(np.mean(recalls)),
+    }
+
+# 🔹 Runner
+def run(sizes, backends, embedding="model", k=10, num_queries=200, warmup=10):
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    # VectorStoreIndex needs Settings.embed_model even when vectors are precomputed
+    embed_model = configure_settings()
+    ctx = mp.get_context("spawn")
+    runs = []
+
+    for num_chunks in sizes:
+        print("\n" + "="*80)
+        print(f"Corpus: {num_chunks} chunks")
+        print("="*80)
+
+        corpus_dir, chunks, queries = load_corpus(num_chunks)
+        queries = queries[:num_queries]
+
+        print(f"🧮 Embedding corpus ({embedding})...")
+        vectors, embed_seconds = corpus_vectors(corpus_dir, chunks, embedding, embed_model)
+        qvectors = query_vectors(queries, vectors, embedding, embed_model)
+
+        print(f"🎯 Exact top-{k} for {len(queries)} queries...")
+        truth = [[chunks[i]["id"] for i in row] for row in exact_top_k(vectors, qvectors, k)]
+
+        for name in backends:
+            storage, faiss_type = BACKENDS[name]
+            index_dir = (BENCH_INDEX_ROOT / str(num_chunks) / name).absolute()
+            index_dir.mkdir(parents=True, exist_ok=True)
+
+            print(f"\n📊 [{name}] building...")
+            stats = build(storage, faiss_type, chunks, vectors, index_dir)
+
+            print(f"⏱️  [{name}] loading + querying...")
+            with ctx.Pool(1) as pool:
+                stats.update(pool.apply(
+                    measure_serving,
+                    (storage, str(index_dir), queries, qvectors, truth, k, warmup)
+                ))
+
+            runs.append({
+                "corpus_chunks": num_chunks,
+                "backend": name,
+                "storage": storage,
+                "faiss_type": faiss_type,
+                "embed_seconds": embed_seconds,
+                **stats,
+            })
+            print(
+                f"   build {stats['build_seconds']:.1f}s | disk {stats['disk_bytes'] / 1e6:.1f}MB | "
+                f"index load {stats['index_load_seconds']:.2f}s (init {stats['init_seconds']:.1f}s) | RSS {stats['rss_mb_loaded']:.0f}MB | "
+                f"p95 {stats['latency_ms']['p95']:.2f}ms | {stats['qps']:.0f} QPS | "
+                f"recall@{k} {stats['recall_at_k']:.3f}"
+            )
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "settings": {"embedding": embedding, "k": k, "num_queries": num_queries, "warmup": warmup},
+        "runs": runs,
+    }
+
+# 🔹 Regression check
+def metric(run, name):
+    value = run
+    for part in name.split("."):
+        # Reports written before a metric existed simply lack it
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def compare(report, baseline, tolerance):
+    """Return human-readable regressions beyond `tolerance` (fraction) vs a baseline report"""
+    previous = {(r["corpus_chunks"], r["backend"]): r for r in baseline["runs"]}
+    regressions = []
+    for run in report["runs"]:
+        old = previous.get((run["corpus_chunks"], run["backend"]))
+        if old is None:
+            continue
+        for name, higher_is_better in REGRESSION_METRICS.items():
+            new_value, old_value = metric(run, name), metric(old, name)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(
+                    f"{run['backend']} @ {run['corpus_chunks']}: {name} "
+                    f"{old_value:.4g} → {new_value:.4g} ({change:+.1%})"
+                )
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval per storage backend")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000],
+                        help="Synthetic corpus sizes in chunks, e.g. 10000 100000 1000000")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--embedding", choices=["model", "random"], default="model",
+                        help="model = real MiniLM embeddings, random = unit vectors (index cost only)")
+    parser.add_argument("--k", type=int, default=10, help="Top-k for latency and recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries")
+    parser.add_argument("--output", default=None, help="JSON report path")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed relative regression vs --baseline")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # --output / --baseline are relative to where the command was run
+    if args.output:
+        args.output = Path(args.output).resolve()
+    if args.baseline:
+        args.baseline = Path(args.baseline).resolve()
+
+    # Paths (data/, indexes/, benchmarks/) are relative to the project root
+    os.chdir(Path(__file__).parent.parent)
+
+    print("="*80)
+    print("Retrieval Benchmark")
+    print("="*80)
+
+    report = run(args.sizes, args.backends, embedding=args.embedding, k=args.k, num_queries=args.queries)
+
+    output = Path(args.output or RESULTS_DIR / f"retrieval_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to: {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print(f"   - {line}")
+            exit(1)
+        print(f"\n✅ No regressions vs {args.baseline}")
@@ -2,9 +2,9 @@
 
 # 👉 Interactive CLI demo for Financial Compliance Copilot
 
-from rag_chain import ComplianceRAG
-from ner_infer import FinancialNER
-import sys
+# Heavy imports (torch, llama_index, langchain) only happen when a model is first used
+from lazy_models import lazy_rag, lazy_ner, startup_profile, warm_up_in_background
+import argparse
 
 def print_banner():
     banner = """
@@ -31,22 +31,45 @@ Examples:
     """
     print(help_text)
 
-def main():
-    print_banner()
-    
-    print("🔧 Initializing systems...")
+def stream_answer(rag, question):
+    """Print sources first, then tokens as they are generated"""
+    for event in rag.stream_answer(question, verbose=False):
+        if event["type"] == "sources":
+            print(f"📚 {len(event['sources'])} sources retrieved")
+            print("\n🤖 Answer:")
+        elif event["type"] == "token":
+            print(event["content"], end="", flush=True)
+        elif event["type"] == "error":
+            print(event["message"])
+        elif event["type"] == "done":
+            print()
+
+def load(model):
+    """Build a model on first use; None (with setup hints) if it can't load"""
+    if not model.loaded:
+        print(f"🔧 Loading {model.name.upper()} (first use)...")
     try:
-        rag = ComplianceRAG()
-        ner = FinancialNER()
+        return model.get()
     except Exception as e:
         print(f"❌ Initialization failed: {e}")
         print("\nMake sure you've run:")
         print("  1. python src/create_sample_data.py")
         print("  2. python src/ner_train.py")
         print("  3. python src/ingest_index.py")
-        sys.exit(1)
+        return None
+
+def main(warmup=False, profile=False):
+    print_banner()
+    
+    # Nothing is loaded yet: `ner` users never wait for the RAG stack
+    rag_model = lazy_rag()
+    ner_model = lazy_ner()
+    if warmup:
+        print("🔥 Warming up models in the background...")
+        warm_up_in_background([rag_model, ner_model])
     
-    print("✅ All systems ready!\n")
+    startup_profile.mark("cli_ready")
+    print("✅ Ready!\n")
     print_help()
     
     while True:
@@ -73,9 +96,11 @@ def main():
                     continue
                 
                 question = parts[1]
+                rag = load(rag_model)
+                if rag is None:
+                    continue
                 print(f"\n🔍 Searching knowledge base...")
-                answer = rag.answer(question, verbose=False)
-                print(f"\n🤖 Answer:\n{answer}")
+                stream_answer(rag, question)
             
             elif command == "ner":
                 if len(parts) < 2:
@@ -83,6 +108,9 @@ def main():
                     continue
                 
                 text = parts[1]
+                ner = load(ner_model)
+                if ner is None:
+                    continue
                 print(f"\n🔍 Extracting entities...")
                 entities = ner.extract_grouped(text)
                 
@@ -95,15 +123,29 @@ def main():
             
             else:
                 # Assume it's a question if no command specified
+                rag = load(rag_model)
+                if rag is None:
+                    continue
                 print(f"\n🔍 Searching knowledge base...")
-                answer = rag.answer(user_input, verbose=False)
-                print(f"\n🤖 Answer:\n{answer}")
+                stream_answer(rag, user_input)
         
         except KeyboardInterrupt:
             print("\n👋 Goodbye!")
             break
         except Exception as e:
             print(f"❌ Error: {e}")
+    
+    if profile:
+        startup_profile.report()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Financial Compliance Copilot CLI")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Load RAG + NER in the background while you type")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the startup profile on exit")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    main(warmup=args.warmup, profile=args.profile)
\ No newline at end of file
@@ -0,0 +1,160 @@
+# 📁 context_builder.py
+
+# 👉 Pack retrieved chunks into the prompt: score order, dedup, overlap trimming, token budget
+
+from dataclasses import dataclass, asdict
+import math
+import re
+
+SEPARATOR = "\n\n---\n\n"
+
+# Prompt tokens available for retrieved context (the rest of the prompt is ~100 tokens)
+CONTEXT_TOKEN_BUDGET = 1024
+
+# Chunks sharing this fraction of their word 3-grams with a kept chunk are dropped
+DUPLICATE_THRESHOLD = 0.8
+
+# Chunks scoring below this fraction of the best score are dropped (low-relevance tail)
+MIN_RELATIVE_SCORE = 0.5
+
+# Shortest shared run of words treated as chunk overlap (chunk_overlap=20 tokens ≈ 15 words)
+MIN_OVERLAP_WORDS = 5
+MAX_OVERLAP_WORDS = 64
+
+WORD_PATTERN = re.compile(r"\S+")
+
+def approx_tokens(text):
+    """~4 characters per token - close enough for Llama-family tokenizers on English"""
+    return math.ceil(len(text) / 4)
+
+@dataclass
+class ContextStats:
+    input_chunks: int = 0
+    used_chunks: int = 0
+    dropped_low_score: int = 0
+    dropped_duplicates: int = 0
+    dropped_budget: int = 0
+    overlap_words_trimmed: int = 0
+    tokens_before: int = 0   # naive join of every retrieved chunk
+    tokens_after: int = 0
+    tokens_saved: int = 0
+
+    def to_dict(self):
+        return asdict(self)
+
+def shingles(words, n=3):
+    words = [w.lower() for w in words]
+    if len(words) < n:
+        return {tuple(words)}
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+def overlap_length(head_words, tail_words):
+    """Longest k such that the last k words of head_words open tail_words"""
+    limit = min(len(head_words), len(tail_words), MAX_OVERLAP_WORDS)
+    for k in range(limit, MIN_OVERLAP_WORDS - 1, -1):
+        if head_words[-k:] == tail_words[:k]:
+            return k
+    return 0
+
+class ContextBuilder:
+    """
+    Turn retrieved nodes into the context block of the prompt
+
+    1. order by score, drop the low-relevance tail
+    2. drop near-duplicates of chunks already kept
+    3. trim text a kept chunk already contains (chunk_overlap between neighbours)
+    4. stop adding chunks once the token budget is spent
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, duplicate_threshold=DUPLICATE_THRESHOLD,
+                 min_relative_score=MIN_RELATIVE_SCORE, count_tokens=approx_tokens):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.min_relative_score = min_relative_score
+        self.count_tokens = count_tokens
+
+    def build(self, docs):
+        """Returns (context text, nodes used - best first, ContextStats)"""
+        stats = ContextStats(input_chunks=len(docs))
+        stats.tokens_before = self.count_tokens(SEPARATOR.join(d.text for d in docs))
+
+        docs = sorted(docs, key=lambda d: d.score or 0.0, reverse=True)
+
+        # Low-relevance tail (only meaningful with positive scores)
+        if self.min_relative_score and docs and (docs[0].score or 0.0) > 0:
+            cutoff = docs[0].score * self.min_relative_score
+            kept = [docs[0]] + [d for d in docs[1:] if (d.score or 0.0) >= cutoff]
+            stats.dropped_low_score = len(docs) - len(kept)
+            docs = kept
+
+        used, texts, kept_words, kept_shingles = [], [], [], []
+        used_tokens = 0
+
+        for doc in docs:
+            words = WORD_PATTERN.findall(doc.text)
+            grams = shingles(words)
+            if any(
+                len(grams & other) / max(1, min(len(grams), len(other))) >= self.duplicate_threshold
+                for other in kept_shingles
+            ):
+                stats.dropped_duplicates += 1
+                continue
+
+            text, trimmed = self._trim_overlap(doc.text, words, kept_words)
+            if not text.strip():
+                stats.dropped_duplicates += 1
+                continue
+
+            cost = self.count_tokens(text) + (self.count_tokens(SEPARATOR) if texts else 0)
+            if used_tokens + cost > self.token_budget:
+                if texts:
+                    # Later (lower scored) chunks may still fit
+                    stats.dropped_budget += 1
+                    continue
+                # Never send an empty context: cut the best chunk down to the budget
+                text = self._truncate(text, self.token_budget)
+                cost = self.count_tokens(text)
+
+            used.append(doc)
+            texts.append(text)
+            kept_words.append(words)
+            kept_shingles.append(grams)
+            used_tokens += cost
+            stats.overlap_words_trimmed += trimmed
+
+        context = SEPARATOR.join(texts)
+        stats.used_chunks = len(used)
+        stats.tokens_after = self.count_tokens(context)
+        stats.tokens_saved = max(0, stats.tokens_before - stats.tokens_after)
+        return context, used, stats
+
+    def _truncate(self, text, budget):
+        """Longest prefix of text within budget tokens, measured with count_tokens"""
+        if self.count_tokens(text) <= budget:
+            return text
+        # Binary search on characters: O(log n) tokenizer calls for any count_tokens
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    @staticmethod
+    def _trim_overlap(text, words, kept_words):
+        """Cut a leading/trailing run of words that a kept chunk already ends/starts with"""
+        lead = max((overlap_length(other, words) for other in kept_words), default=0)
+        trail = max((overlap_length(words, other) for other in kept_words), default=0)
+        if lead + trail >= len(words):
+            return "", len(words)
+        if not (lead or trail):
+            return text, 0
+
+        spans = [m.span() for m in WORD_PATTERN.finditer(text)]
+        start = spans[lead][0] if lead else 0
+        end = spans[len(words) - trail - 1][1] if trail else len(text)
+        prefix = "… " if lead else ""
+        suffix = " …" if trail else ""
+        return prefix + text[start:end] + suffix, lead + trail
@@ -14,6 +14,9 @@ import random
 # Path is safer than string paths for file operations
 from pathlib import Path
 
+# Command-line flags (synthetic benchmark corpora)
+import argparse
+
 # Fix randomness so results are reproducible
 random.seed(42)
 
@@ -135,13 +138,104 @@ def write_qa_eval():
     with open("data/qa_eval.json", "w") as f:
         json.dump(qa, f, indent=2)
 
+## 🔹 Synthetic policy corpus (retrieval benchmarks)
+# Vocabulary the templated policy paragraphs are drawn from
+TOPICS = [
+    "KYC", "AML", "sanctions screening", "fraud prevention", "data retention",
+    "trade surveillance", "market abuse", "insider trading", "credit risk",
+    "liquidity reporting", "customer complaints", "whistleblowing",
+    "anti-bribery", "vendor due diligence", "cyber security", "record keeping",
+]
+SUBJECTS = [
+    "retail customers", "corporate clients", "correspondent banks",
+    "politically exposed persons", "trusts and foundations", "payment processors",
+    "crypto asset providers", "non-resident accounts", "high-risk jurisdictions",
+    "third-party vendors", "branch staff", "relationship managers",
+]
+ACTIONS = [
+    "must be reviewed by the compliance officer",
+    "must be escalated to the MLRO within 24 hours",
+    "require enhanced due diligence",
+    "must be re-verified every 12 months",
+    "must be reported to the regulator",
+    "require dual approval before release",
+    "must be logged in the case management system",
+    "are subject to quarterly audit",
+]
+DOCUMENTS = [
+    "Government ID", "address proof", "source of funds declaration",
+    "beneficial ownership register", "board resolution", "bank statement",
+    "tax residency certificate", "signed mandate",
+]
+THRESHOLDS = ["5,000", "10,000", "25,000", "50,000", "100,000", "250,000"]
+CURRENCIES = ["USD", "EUR", "GBP", "INR"]
+
+def gen_policy_chunk(rng, i):
+    """One chunk-sized policy paragraph (stays under CHUNK_SIZE tokens)"""
+    topic = rng.choice(TOPICS)
+    subject = rng.choice(SUBJECTS)
+    body = [
+        f"Transactions above {rng.choice(THRESHOLDS)} {rng.choice(CURRENCIES)} {rng.choice(ACTIONS)}.",
+        f"Onboarding of {subject} requires {rng.choice(DOCUMENTS)} and {rng.choice(DOCUMENTS)}.",
+        f"Exceptions to the {topic} policy {rng.choice(ACTIONS)}.",
+    ]
+    rng.shuffle(body)
+    text = " ".join([f"Section {i}: {topic} requirements for {subject}."] + body)
+    return {"id": f"chunk-{i}", "topic": topic, "subject": subject, "text": text}
+
+def gen_policy_query(rng):
+    topic = rng.choice(TOPICS)
+    subject = rng.choice(SUBJECTS)
+    return rng.choice([
+        f"What are the {topic} requirements for {subject}?",
+        f"Which documents are needed to onboard {subject}?",
+        f"When must {topic} exceptions be escalated?",
+        f"What is the transaction threshold for {subject} under {topic}?",
+    ])
+
+def write_synthetic_corpus(num_chunks, out_dir=None, shard_size=100_000,
+                           num_queries=1000, seed=42):
+    """
+    Write num_chunks policy paragraphs as JSONL shards (one chunk per line)
+    plus a queries.jsonl file, under data/synthetic/<num_chunks>/
+
+    Chunks are already sized for the index, so benchmarks can skip the
+    reader/splitter and go straight to embedding + indexing.
+    """
+    out_dir = Path(out_dir or f"data/synthetic/{num_chunks}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+
+    for shard, start in enumerate(range(0, num_chunks, shard_size)):
+        with open(out_dir / f"chunks-{shard:05d}.jsonl", "w") as f:
+            for i in range(start, min(start + shard_size, num_chunks)):
+                f.write(json.dumps(gen_policy_chunk(rng, i)) + "\n")
+
+    with open(out_dir / "queries.jsonl", "w") as f:
+        for _ in range(num_queries):
+            f.write(json.dumps({"query": gen_policy_query(rng)}) + "\n")
+
+    print(f"✅ {num_chunks} synthetic chunks → {out_dir}/")
+    return out_dir
+
 ## 🔹 Main execution
-def main():
+def main(synthetic=None):
     ensure_dirs()
     write_docs()
     ner_data = gen_ner_examples()
     write_ner_train(ner_data)
     write_qa_eval()
 
+    # Optional benchmark corpora, e.g. --synthetic 10000 100000 1000000
+    for num_chunks in synthetic or []:
+        write_synthetic_corpus(num_chunks)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create sample documents, NER and evaluation data")
+    parser.add_argument("--synthetic", type=int, nargs="*", default=None, metavar="N",
+                        help="Also write synthetic policy corpora with N chunks each")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    main(synthetic=args.synthetic)
\ No newline at end of file
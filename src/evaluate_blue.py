@@ -4,9 +4,19 @@
 
 import json
 from pathlib import Path
+import argparse
+import asyncio
+import time
 import os
+import numpy as np
 from sacrebleu.metrics import BLEU
 from rag_chain import ComplianceRAG
+from llm_gateway import LLMUnavailable
+from metrics import Trace, current_trace
+
+# Marks a question the LLM gateway refused (queue full / timeout / deadline):
+# reported separately and left out of BLEU instead of scoring an empty answer
+REJECTED = "rejected"
 
 def load_qa_eval():
     """Load gold Q/A pairs for evaluation"""
@@ -20,8 +30,116 @@ def load_qa_eval():
     with open(qa_path) as f:
         return json.load(f)
 
-def evaluate_rag():
-    """Evaluate RAG system using BLEU score"""
+def print_prediction(i, total, qa, result):
+    print(f"\n[{i}/{total}] Question: {qa['question']}")
+    print(f"   📌 Gold:      {qa['answer']}")
+    if result is REJECTED:
+        print("   ⏳ Rejected by the LLM gateway (not scored)")
+        return
+    print(f"   🤖 Predicted: {result.answer if result else ''}")
+    if result:
+        print(f"   ⏱️  {result.timings.get('total', 0):.2f}s")
+
+def add_queue_wait(result, trace):
+    """Gateway queue wait (recorded on the trace) next to the stage timings"""
+    if result is not None and result is not REJECTED:
+        result.timings["queue_wait"] = trace.stages.get("llm.queue_wait", 0.0)
+    return result
+
+def run_sequential(rag, qa_pairs):
+    results = []
+    for i, qa in enumerate(qa_pairs, 1):
+        trace = Trace("evaluate")
+        token = current_trace.set(trace)
+        # Get RAG prediction in CONCISE mode
+        try:
+            result = rag.answer(qa["question"], verbose=False, concise=True)
+        except LLMUnavailable:
+            result = REJECTED
+        except Exception as e:
+            print(f"   ❌ Error generating answer: {e}")
+            result = None
+        finally:
+            current_trace.reset(token)
+        result = add_queue_wait(result, trace)
+        print_prediction(i, len(qa_pairs), qa, result)
+        results.append(result)
+    return results
+
+async def run_concurrent(rag, qa_pairs, concurrency):
+    """At most `concurrency` generations in flight against Ollama"""
+    # More would only wait in (or overflow) the gateway queue - same cap as /ask/batch
+    if concurrency > rag.llm.max_in_flight:
+        print(f"   ⚠️  Concurrency capped at {rag.llm.max_in_flight} (LLM_MAX_IN_FLIGHT)")
+        concurrency = rag.llm.max_in_flight
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def run_one(qa):
+        nonlocal done
+        # Each gathered task has its own context, so the trace is per question
+        trace = Trace("evaluate")
+        current_trace.set(trace)
+        async with semaphore:
+            try:
+                result = await rag.aanswer(qa["question"], concise=True)
+            except LLMUnavailable:
+                result = REJECTED
+            except Exception as e:
+                print(f"   ❌ Error generating answer: {e}")
+                result = None
+        result = add_queue_wait(result, trace)
+        done += 1
+        print_prediction(done, len(qa_pairs), qa, result)
+        return result
+
+    return await asyncio.gather(*[run_one(qa) for qa in qa_pairs])
+
+def latency_summary(values):
+    if not values:
+        return {}
+    values = np.asarray(values)
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+def performance_report(results, wall_seconds, concurrency, batch_embedding_seconds):
+    """Latency percentiles per stage, token throughput and question throughput"""
+    ok = [r for r in results if r is not None and r is not REJECTED]
+    rejected = sum(1 for r in results if r is REJECTED)
+    stages = ["embedding", "retrieval", "prompt", "queue_wait", "generation", "total"]
+
+    output_tokens = sum(r.usage.get("output_tokens", 0) for r in ok)
+    prompt_tokens = sum(r.usage.get("prompt_tokens", 0) for r in ok)
+    # generation includes the gateway queue wait - decode speed must not
+    generation_seconds = sum(r.timings.get("generation", 0) - r.timings.get("queue_wait", 0) for r in ok)
+
+    return {
+        "concurrency": concurrency,
+        "num_completed": len(ok),
+        "num_rejected": rejected,
+        "num_failed": len(results) - len(ok) - rejected,
+        "wall_seconds": wall_seconds,
+        "batch_embedding_seconds": batch_embedding_seconds,
+        "throughput_qps": len(ok) / wall_seconds if wall_seconds > 0 else 0.0,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "context_tokens_saved": sum(r.context.get("tokens_saved", 0) for r in ok),
+        # Per-stream decode speed, and aggregate across concurrent streams
+        "tokens_per_sec": output_tokens / generation_seconds if generation_seconds > 0 else 0.0,
+        "aggregate_tokens_per_sec": output_tokens / wall_seconds if wall_seconds > 0 else 0.0,
+        "latency_seconds": {
+            stage: latency_summary([r.timings[stage] for r in ok if stage in r.timings])
+            for stage in stages
+        },
+    }
+
+def evaluate_rag(concurrency=1):
+    """Evaluate RAG system using BLEU score (+ latency/throughput)"""
     
     # Change to project root
     script_dir = Path(__file__).parent
@@ -44,7 +162,8 @@ def evaluate_rag():
     # Initialize RAG system
     print("\n🤖 Initializing RAG system...")
     try:
-        rag = ComplianceRAG()
+        # No answer cache: every question must really be generated
+        rag = ComplianceRAG(cache=False)
     except Exception as e:
         print(f"❌ Failed to initialize RAG: {e}")
         return None
@@ -59,27 +178,25 @@ def evaluate_rag():
     print("Running Evaluation (Concise Mode for BLEU)")
     print("="*80)
     
-    # Evaluate each Q/A pair
-    for i, qa in enumerate(qa_pairs, 1):
-        question = qa["question"]
-        gold_answer = qa["answer"]
-        
-        print(f"\n[{i}/{len(qa_pairs)}] Question: {question}")
-        
-        # Get RAG prediction in CONCISE mode
-        try:
-            predicted_answer = rag.answer(question, verbose=False, concise=True)
-        except Exception as e:
-            print(f"   ❌ Error generating answer: {e}")
-            predicted_answer = ""
-        
-        print(f"   📌 Gold:      {gold_answer}")
-        print(f"   🤖 Predicted: {predicted_answer}")
-        
-        predictions.append(predicted_answer)
-        references.append([gold_answer])
+    # Embed every question in one batch up front
+    stage = time.perf_counter()
+    rag.embed_queries([qa["question"] for qa in qa_pairs])
+    batch_embedding_seconds = time.perf_counter() - stage
+    
+    # Evaluate each Q/A pair (sequentially, or with bounded parallelism)
+    start = time.perf_counter()
+    if concurrency > 1:
+        print(f"\n⚡ Running {len(qa_pairs)} questions with concurrency={concurrency}")
+        answers = asyncio.run(run_concurrent(rag, qa_pairs, concurrency))
+    else:
+        answers = run_sequential(rag, qa_pairs)
+    wall_seconds = time.perf_counter() - start
     
-    # Rest of the code remains the same...  # BLEU expects list of references
+    for qa, result in zip(qa_pairs, answers):
+        if result is REJECTED:
+            continue
+        predictions.append(result.answer if result else "")
+        references.append([qa["answer"]])  # BLEU expects list of references
     
     # Calculate BLEU score
     print("\n" + "="*80)
@@ -88,8 +205,12 @@ def evaluate_rag():
     
     score = bleu.corpus_score(predictions, references)
     
+    rejected = sum(1 for result in answers if result is REJECTED)
+    
     print(f"\n📊 Results:")
     print(f"   BLEU Score: {score.score:.2f}")
+    if rejected:
+        print(f"   ⚠️  {rejected} question(s) rejected by the LLM gateway - BLEU covers the other {len(predictions)}")
     print(f"   Precision:")
     print(f"     - 1-gram: {score.precisions[0]:.2f}")
     print(f"     - 2-gram: {score.precisions[1]:.2f}")
@@ -107,6 +228,21 @@ def evaluate_rag():
     else:
         print("   ❌ Poor - Significant improvements needed")
     
+    performance = performance_report(answers, wall_seconds, concurrency, batch_embedding_seconds)
+    total = performance["latency_seconds"]["total"]
+    
+    print(f"\n⚡ Performance (concurrency={concurrency}):")
+    print(f"   Throughput: {performance['throughput_qps']:.2f} questions/s "
+          f"({performance['wall_seconds']:.1f}s wall clock)")
+    if total:
+        print(f"   Latency:    p50 {total['p50']:.2f}s | p95 {total['p95']:.2f}s | p99 {total['p99']:.2f}s")
+    print(f"   Tokens/sec: {performance['tokens_per_sec']:.1f} per stream, "
+          f"{performance['aggregate_tokens_per_sec']:.1f} aggregate")
+    for stage in ["embedding", "retrieval", "prompt", "queue_wait", "generation"]:
+        stats = performance["latency_seconds"][stage]
+        if stats:
+            print(f"   - {stage:10s} p50 {stats['p50']*1000:8.1f}ms | p95 {stats['p95']*1000:8.1f}ms")
+    
     print("\n" + "="*80)
     
     # Save detailed results
@@ -119,13 +255,19 @@ def evaluate_rag():
             "4-gram": score.precisions[3]
         },
         "num_questions": len(qa_pairs),
+        "num_scored": len(predictions),
+        "performance": performance,
         "predictions": [
             {
                 "question": qa["question"],
                 "gold": qa["answer"],
-                "predicted": pred
+                "predicted": None if result is REJECTED else (result.answer if result else ""),
+                "rejected": result is REJECTED,
+                "timings": result.timings if result and result is not REJECTED else {},
+                "usage": result.usage if result and result is not REJECTED else {},
+                "context": result.context if result and result is not REJECTED else {}
             }
-            for qa, pred in zip(qa_pairs, predictions)
+            for qa, result in zip(qa_pairs, answers)
         ]
     }
     
@@ -138,8 +280,15 @@ def evaluate_rag():
     
     return score.score
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate the RAG system (BLEU + latency)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Max questions in flight against Ollama (1 = sequential, capped at LLM_MAX_IN_FLIGHT)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    score = evaluate_rag()
+    args = parse_args()
+    score = evaluate_rag(concurrency=args.concurrency)
     
     if score is None:
         print("\n❌ Evaluation failed. Make sure:")
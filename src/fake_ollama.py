@@ -0,0 +1,155 @@
+# 📁 fake_ollama.py
+
+# 👉 Stand-in Ollama server for load / backpressure tests (no model, no GPU)
+
+# Speaks the parts of the Ollama API ChatOllama uses (/api/chat, streamed or not)
+# and behaves like a busy server: at most --parallel generations run at once, the
+# rest queue, every token takes --token-delay seconds. A client that disconnects
+# stops its generation - /fake/stats shows how many were cancelled. --fail-rate
+# makes some calls fail with HTTP 500 to exercise failover across hosts.
+#
+# Usage:
+#   python src/fake_ollama.py --port 11435 --parallel 2 --token-delay 0.05
+#   OLLAMA_HOST=http://localhost:11435 LLM_MAX_IN_FLIGHT=2 python src/api.py
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import random
+import time
+import uvicorn
+
+app = FastAPI(title="Fake Ollama")
+
+settings = {
+    "parallel": 1,
+    "tokens": 32,
+    "token_delay": 0.02,
+    "first_token_delay": 0.05,
+    "fail_rate": 0.0,
+}
+stats = {"running": 0, "queued": 0, "completed": 0, "cancelled": 0, "failed": 0}
+slots = None  # asyncio.Semaphore(parallel), created on the server's loop
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+def fake_tokens(messages):
+    """Deterministic answer that echoes the end of the question"""
+    question = messages[-1].get("content", "") if messages else ""
+    tail = " ".join(question.split()[-5:])
+    words = f"This is a fake answer about {tail}.".split()
+    words += [f"detail{i}" for i in range(max(0, settings["tokens"] - len(words)))]
+    return [w + " " for w in words[: settings["tokens"]]]
+
+def final_chunk(model, prompt_tokens, output_tokens, started, content=""):
+    return {
+        "model": model,
+        "created_at": now(),
+        "message": {"role": "assistant", "content": content},
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int((time.perf_counter() - started) * 1e9),
+        "load_duration": 0,
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": 0,
+        "eval_count": output_tokens,
+        "eval_duration": int(output_tokens * settings["token_delay"] * 1e9),
+    }
+
+async def generate(request, body):
+    """Yield tokens once a slot is free; stops when the client goes away"""
+    global slots
+    if slots is None:
+        slots = asyncio.Semaphore(settings["parallel"])
+
+    stats["queued"] += 1
+    try:
+        await slots.acquire()
+    finally:
+        stats["queued"] -= 1
+
+    stats["running"] += 1
+    finished = False
+    try:
+        await asyncio.sleep(settings["first_token_delay"])
+        for token in fake_tokens(body.get("messages", [])):
+            if await request.is_disconnected():
+                return
+            yield token
+            await asyncio.sleep(settings["token_delay"])
+        finished = True
+    finally:
+        stats["running"] -= 1
+        stats["completed" if finished else "cancelled"] += 1
+        slots.release()
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    if random.random() < settings["fail_rate"]:
+        stats["failed"] += 1
+        return JSONResponse({"error": "fake failure"}, status_code=500)
+    prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+    started = time.perf_counter()
+
+    if body.get("stream", True):
+        async def lines():
+            count = 0
+            async for token in generate(request, body):
+                count += 1
+                chunk = {"model": model, "created_at": now(),
+                         "message": {"role": "assistant", "content": token}, "done": False}
+                yield json.dumps(chunk) + "\n"
+            if count == len(fake_tokens(body.get("messages", []))):
+                yield json.dumps(final_chunk(model, prompt_tokens, count, started)) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    tokens = [token async for token in generate(request, body)]
+    return JSONResponse(final_chunk(model, prompt_tokens, len(tokens), started, "".join(tokens)))
+
+@app.get("/")
+def root():
+    return PlainTextResponse("Ollama is running")
+
+@app.get("/api/version")
+def version():
+    return {"version": "0.0.0-fake"}
+
+@app.get("/api/tags")
+def tags():
+    return {"models": [{"name": "llama3.2:latest", "model": "llama3.2:latest"}]}
+
+@app.get("/fake/stats")
+def fake_stats():
+    return {**stats, **settings}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="Generations at once (like OLLAMA_NUM_PARALLEL); others queue")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens per answer")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds per token")
+    parser.add_argument("--first-token-delay", type=float, default=0.05,
+                        help="Seconds before the first token (prompt processing)")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Fraction of /api/chat calls answered with HTTP 500 (failover tests)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    settings.update(
+        parallel=args.parallel,
+        tokens=args.tokens,
+        token_delay=args.token_delay,
+        first_token_delay=args.first_token_delay,
+        fail_rate=args.fail_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -2,57 +2,309 @@
 
 # 👉 Build vector index for RAG
 
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, load_index_from_storage
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.vector_stores.faiss import FaissVectorStore
+from collections import deque
 from pathlib import Path
+import multiprocessing as mp
+import threading
+import argparse
+import hashlib
+import queue
+import json
+import os
+import numpy as np
 
-def main():
-    print("="*80)
-    print("Building Vector Index for RAG")
-    print("="*80)
-    
-    # Create indexes directory
-    Path("indexes").mkdir(parents=True, exist_ok=True)
-    
-    # Load documents
-    print("\n📄 Loading documents from data/docs/...")
+from vector_store import (
+    EMBED_MODEL_NAME,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    EMBED_BATCH_SIZE,
+    STORAGE_BACKENDS,
+    FAISS_INDEX_TYPES,
+    configure_settings,
+    index_dir_for,
+    create_faiss_index,
+    train_faiss_index,
+    load_storage_context,
+    reconstruct_vectors,
+)
+from sparse_index import SparseIndex, SPARSE_FILE_NAME
+
+DOCS_DIR = "data/docs"
+
+# Files parsed + chunked ahead of the embedding stage
+PIPELINE_QUEUE_SIZE = 64
+
+# Per-file content hashes + per-chunk hashes, stored next to the index
+MANIFEST_NAME = "ingest_manifest.json"
+
+# 🔹 Hashing helpers
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_text(node):
+    # Exactly the text VectorStoreIndex would embed
+    return node.get_content(metadata_mode=MetadataMode.EMBED)
+
+def file_key(path):
+    # Manifest keys are relative so the project can move without a full re-embed
+    return os.path.relpath(path)
+
+def chunk_sha256(node):
+    return hashlib.sha256(chunk_text(node).encode("utf-8")).hexdigest()
+
+# 🔹 Manifest
+def index_settings(storage, faiss_type):
+    # Any change here invalidates every stored vector → full rebuild
+    return {
+        "embed_model": EMBED_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "storage": storage,
+        "faiss_type": faiss_type if storage == "faiss" else None,
+    }
+
+def load_manifest(index_dir):
+    path = Path(index_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(index_dir, settings, files):
+    path = Path(index_dir) / MANIFEST_NAME
+    with open(path, "w") as f:
+        json.dump({"settings": settings, "files": files}, f, indent=2)
+
+def manifest_entries(docs, nodes, file_hashes):
+    """Group documents and chunks by source file for the manifest"""
+    files = {
+        file_path: {"sha256": sha, "doc_ids": [], "chunks": {}}
+        for file_path, sha in file_hashes.items()
+    }
+    for doc in docs:
+        files[file_key(doc.metadata["file_path"])]["doc_ids"].append(doc.doc_id)
+    for node in nodes:
+        files[file_key(node.metadata["file_path"])]["chunks"][node.node_id] = chunk_sha256(node)
+    return files
+
+# 🔹 Loading + chunking + embedding
+def list_input_files(docs_dir=DOCS_DIR):
+    reader = SimpleDirectoryReader(docs_dir)
+    return [file_key(p) for p in reader.input_files]
+
+def load_documents(input_files):
+    # filename_as_id keeps ref_doc_ids stable across runs so they can be deleted later
+    reader = SimpleDirectoryReader(input_files=input_files, filename_as_id=True)
+    return reader.load_data()
+
+def chunk_documents(docs, show_progress=True):
+    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return splitter.get_nodes_from_documents(docs, show_progress=show_progress)
+
+# 🔹 Embedding workers (one model per process, CPU threads split between them)
+_embed_model = None
+
+def init_embed_worker(model_name, threads, batch_size):
+    global _embed_model
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    _embed_model = HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size)
+
+def embed_texts(texts):
+    return _embed_model.get_text_embedding_batch(texts)
+
+# 🔹 Parse → chunk → embed pipeline
+def read_and_chunk(input_files, out_queue):
+    """Producer stage: parse one file at a time and hand its chunks downstream"""
     try:
-        docs = SimpleDirectoryReader("data/docs").load_data()
-        print(f"   ✅ Loaded {len(docs)} documents")
+        for path in input_files:
+            docs = load_documents([path])
+            out_queue.put((docs, chunk_documents(docs, show_progress=False)))
+    except Exception as e:
+        out_queue.put(e)
+    finally:
+        out_queue.put(None)
+
+def ingest_pipeline(input_files, embed_model, batch_size=EMBED_BATCH_SIZE, workers=1,
+                    reuse_vectors=None):
+    """
+    Parse, chunk and embed files as overlapping stages
+
+    A reader thread parses + chunks files into a bounded queue while chunks
+    are embedded in batches of batch_size - in this process, or across
+    `workers` spawned processes with the CPU threads split between them.
+    Chunks whose hash is in reuse_vectors get that vector instead.
+
+    Returns (docs, nodes, number of reused vectors), every node embedded,
+    nodes in input file order
+    """
+    reuse_vectors = reuse_vectors or {}
+    chunks = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    reader = threading.Thread(target=read_and_chunk, args=(input_files, chunks), daemon=True)
+
+    pool = None
+    docs, nodes, pending = [], [], []
+    in_flight = deque()
+    max_in_flight = workers * 2
+    counts = {"embedded": 0, "reused": 0, "batches": 0}
+
+    def assign(batch, embeddings):
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        counts["embedded"] += len(batch)
+        counts["batches"] += 1
+        if counts["batches"] % 10 == 0:
+            print(f"   🧮 {counts['embedded']} chunks embedded...")
+
+    def collect():
+        batch, result = in_flight.popleft()
+        assign(batch, result.get())
+
+    def submit(batch):
+        nonlocal pool
+        texts = [chunk_text(node) for node in batch]
+        if workers <= 1:
+            assign(batch, embed_model.get_text_embedding_batch(texts))
+            return
+        if pool is None:
+            # Started on the first batch: runs with nothing to embed skip the spawn cost
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            pool = mp.get_context("spawn").Pool(
+                workers,
+                initializer=init_embed_worker,
+                initargs=(embed_model.model_name, threads, batch_size)
+            )
+        # Bounded in-flight batches keep memory flat on large corpora
+        in_flight.append((batch, pool.apply_async(embed_texts, (texts,))))
+        while len(in_flight) >= max_in_flight:
+            collect()
+
+    reader.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            file_docs, file_nodes = item
+            docs.extend(file_docs)
+            nodes.extend(file_nodes)
+            for node in file_nodes:
+                vector = reuse_vectors.get(chunk_sha256(node))
+                if vector is not None:
+                    node.embedding = vector
+                    counts["reused"] += 1
+                else:
+                    pending.append(node)
+
+            while len(pending) >= batch_size:
+                submit(pending[:batch_size])
+                del pending[:batch_size]
+
+        if pending:
+            submit(pending)
+        while in_flight:
+            collect()
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    reader.join()
+    print(f"   ✅ {len(docs)} documents → {len(nodes)} chunks "
+          f"({counts['embedded']} embedded, {counts['reused']} reused)")
+    return docs, nodes, counts["reused"]
+
+def node_vectors(nodes):
+    return np.asarray([node.embedding for node in nodes], dtype="float32")
+
+def build_sparse_index(nodes, index_dir):
+    """BM25 index over the chunk texts, saved next to the vector index"""
+    sparse = SparseIndex.from_texts(
+        (node.node_id, node.get_content(metadata_mode=MetadataMode.NONE)) for node in nodes
+    )
+    sparse.save(index_dir)
+    print(f"🔤 BM25 index: {len(sparse)} chunks, {len(sparse.postings)} terms")
+
+def build_storage_context(storage, vectors, faiss_type="flat"):
+    if storage == "faiss":
+        if len(vectors) == 0:
+            # The dimension comes from the vectors - nothing to size (or train) the index with
+            raise ValueError("Cannot build a FAISS index from zero vectors")
+        faiss_index = create_faiss_index(
+            vectors.shape[1],
+            index_type=faiss_type,
+            num_vectors=len(vectors)
+        )
+        train_faiss_index(faiss_index, vectors)
+        return StorageContext.from_defaults(
+            vector_store=FaissVectorStore(faiss_index=faiss_index)
+        )
+    return StorageContext.from_defaults()
+
+# 🔹 Full build
+def build_index(storage="simple", faiss_type="flat", index_dir=None,
+                batch_size=EMBED_BATCH_SIZE, workers=1):
+    index_dir = index_dir_for(storage, index_dir)
+
+    # Find documents
+    print(f"\n📄 Listing documents in {DOCS_DIR}/...")
+    try:
+        input_files = list_input_files()
+        print(f"   ✅ Found {len(input_files)} files")
     except Exception as e:
         print(f"   ❌ Error loading documents: {e}")
         print("   Make sure you've run: python src/create_sample_data.py")
         return
-    
-    if len(docs) == 0:
-        print("   ❌ No documents found in data/docs/")
+
+    if len(input_files) == 0:
+        print(f"   ❌ No documents found in {DOCS_DIR}/")
+        return
+
+    # Set up embedding model
+    print("\n🔧 Setting up embedding model...")
+    embed_model = configure_settings(batch_size)
+
+    # Parse, chunk + embed up front so FAISS (IVF) can be trained before vectors are added
+    print(f"\n🧮 Parsing, chunking + embedding "
+          f"(batch size {batch_size}, {workers} worker{'s' if workers > 1 else ''})...")
+    print("   (This may take a minute...)")
+    docs, nodes, _ = ingest_pipeline(input_files, embed_model, batch_size, workers)
+
+    if len(nodes) == 0:
+        print(f"   ❌ No text found in the documents in {DOCS_DIR}/ - nothing to index")
         return
-    
+
     # Show document details
-    for i, doc in enumerate(docs, 1):
+    for i, doc in enumerate(docs[:5], 1):
         print(f"\n   Document {i}:")
         print(f"   - Source: {doc.metadata.get('file_name', 'unknown')}")
         print(f"   - Length: {len(doc.text)} characters")
         print(f"   - Preview: {doc.text[:100]}...")
-    
-    # Set up embedding model
-    print("\n🔧 Setting up embedding model...")
-    embed_model = HuggingFaceEmbedding(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    Settings.embed_model = embed_model
-    Settings.chunk_size = 256
-    Settings.chunk_overlap = 20
-    
+
     # Build vector index
-    print("\n📊 Building vector index...")
-    print("   (This may take a minute...)")
-    
-    index = VectorStoreIndex.from_documents(
-        docs,
+    label = f"{storage} ({faiss_type})" if storage == "faiss" else storage
+    print(f"\n📊 Building vector index [{label}]...")
+    storage_context = build_storage_context(storage, node_vectors(nodes), faiss_type)
+    index = VectorStoreIndex(
+        nodes,
+        storage_context=storage_context,
         show_progress=True
     )
-    
+
     # Test retrieval before saving
     print("\n🧪 Testing retrieval...")
     retriever = index.as_retriever(similarity_top_k=2)
@@ -61,20 +313,185 @@ def main():
         "AML monitoring",
         "compliance requirements"
     ]
-    
+
     for query in test_queries:
         results = retriever.retrieve(query)
         print(f"   Query: '{query}' → Retrieved {len(results)} documents")
         if results:
             print(f"      Top result score: {results[0].score:.4f}")
-    
+
     # Save index to disk
     print("\n💾 Saving index to disk...")
-    index.storage_context.persist(persist_dir="indexes/simple_index")
-    
+    index.storage_context.persist(persist_dir=str(index_dir))
+    build_sparse_index(nodes, index_dir)
+
+    file_hashes = {path: file_sha256(path) for path in input_files}
+    save_manifest(
+        index_dir,
+        index_settings(storage, faiss_type),
+        manifest_entries(docs, nodes, file_hashes)
+    )
+
     print("\n✅ Vector index built and saved successfully!")
-    print(f"📁 Location: indexes/simple_index/")
+    print(f"📁 Location: {index_dir}/")
+
+# 🔹 Incremental update
+def diff_files(manifest_files, file_hashes):
+    added = [p for p in file_hashes if p not in manifest_files]
+    removed = [p for p in manifest_files if p not in file_hashes]
+    modified = [
+        p for p, sha in file_hashes.items()
+        if p in manifest_files and manifest_files[p]["sha256"] != sha
+    ]
+    return added, modified, removed
+
+def update_index(storage="simple", faiss_type="flat", index_dir=None,
+                 batch_size=EMBED_BATCH_SIZE, workers=1):
+    """
+    Re-embed only added/modified files and drop vectors of removed files.
+    Falls back to a full build when there is no usable manifest.
+    """
+    index_dir = index_dir_for(storage, index_dir)
+    settings = index_settings(storage, faiss_type)
+    manifest = load_manifest(index_dir)
+
+    if manifest is None or manifest["settings"] != settings:
+        print("\n⚠️  No compatible manifest found - running a full build")
+        return build_index(storage, faiss_type, index_dir, batch_size, workers)
+
+    print(f"\n🔎 Hashing files in {DOCS_DIR}/...")
+    input_files = list_input_files()
+    file_hashes = {path: file_sha256(path) for path in input_files}
+    old_files = manifest["files"]
+
+    added, modified, removed = diff_files(old_files, file_hashes)
+    print(f"   ➕ Added:    {len(added)}")
+    print(f"   ✏️  Modified: {len(modified)}")
+    print(f"   ➖ Removed:  {len(removed)}")
+    print(f"   ✔️  Unchanged: {len(file_hashes) - len(added) - len(modified)}")
+
+    if not (added or modified or removed):
+        # Indexes built before BM25 existed only need the sparse side
+        if not (index_dir / SPARSE_FILE_NAME).exists():
+            docstore = SimpleDocumentStore.from_persist_dir(str(index_dir))
+            build_sparse_index(docstore.docs.values(), index_dir)
+        print("\n✅ Index is up to date - nothing to do")
+        return
+
+    embed_model = configure_settings(batch_size)
+
+    # Load existing index (not memory-mapped: we may need to read vectors back)
+    storage_context = load_storage_context(storage, index_dir, mmap=False)
+    index = load_index_from_storage(storage_context)
+
+    def stored_vectors(node_ids):
+        if storage == "faiss":
+            positions = {nid: pos for pos, nid in index.index_struct.nodes_dict.items()}
+            return reconstruct_vectors(
+                index.vector_store.client,
+                [positions[nid] for nid in node_ids]
+            )
+        return [index.vector_store.get(nid) for nid in node_ids]
+
+    # Chunk changed files, reuse vectors of chunks whose text did not change
+    old_chunks = {}
+    for path in modified:
+        for node_id, sha in old_files[path]["chunks"].items():
+            old_chunks.setdefault(sha, node_id)
+    reuse_vectors = {
+        sha: list(map(float, vector))
+        for sha, vector in zip(old_chunks, stored_vectors(list(old_chunks.values())))
+    }
+
+    changed = added + modified
+    print(f"\n🧮 Parsing, chunking + embedding {len(changed)} changed files...")
+    docs, new_nodes, _ = ingest_pipeline(
+        changed, embed_model, batch_size, workers, reuse_vectors=reuse_vectors
+    )
+
+    stale_doc_ids = [
+        doc_id for path in modified + removed
+        for doc_id in old_files[path]["doc_ids"]
+    ]
+
+    if storage == "faiss":
+        # FAISS ids are positional, so rebuild from stored vectors of unchanged files
+        keep_ids = [
+            node_id for path, entry in old_files.items()
+            if path not in modified and path not in removed
+            for node_id in entry["chunks"]
+        ]
+        kept_nodes = index.docstore.get_nodes(keep_ids) if keep_ids else []
+        for node, vector in zip(kept_nodes, stored_vectors(keep_ids)):
+            node.embedding = list(map(float, vector))
+
+        all_nodes = kept_nodes + new_nodes
+        if not all_nodes:
+            print(f"\n❌ No documents left in {DOCS_DIR}/ - nothing to index")
+            return
+        print(f"\n📊 Rebuilding FAISS index ({faiss_type}) from {len(all_nodes)} vectors...")
+        storage_context = build_storage_context(storage, node_vectors(all_nodes), faiss_type)
+        index = VectorStoreIndex(all_nodes, storage_context=storage_context)
+    else:
+        print(f"\n🗑️  Deleting {len(stale_doc_ids)} stale documents...")
+        for doc_id in stale_doc_ids:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        print(f"📊 Inserting {len(new_nodes)} chunks...")
+        index.insert_nodes(new_nodes)
+
+    print("\n💾 Saving index to disk...")
+    index.storage_context.persist(persist_dir=str(index_dir))
+    # BM25 statistics (idf, average length) are corpus-wide, so rebuild - no embedding involved
+    build_sparse_index(index.docstore.docs.values(), index_dir)
+
+    files = {p: e for p, e in old_files.items() if p not in modified and p not in removed}
+    files.update(manifest_entries(
+        docs, new_nodes, {p: file_hashes[p] for p in changed}
+    ))
+    save_manifest(index_dir, settings, files)
+
+    print("\n✅ Vector index updated successfully!")
+    print(f"📁 Location: {index_dir}/")
+
+def main(storage="simple", faiss_type="flat", index_dir=None, incremental=False,
+         batch_size=EMBED_BATCH_SIZE, workers=1):
+    print("="*80)
+    print("Building Vector Index for RAG")
+    print("="*80)
+
+    # Create indexes directory
+    Path("indexes").mkdir(parents=True, exist_ok=True)
+
+    if incremental:
+        update_index(storage, faiss_type, index_dir, batch_size, workers)
+    else:
+        build_index(storage, faiss_type, index_dir, batch_size, workers)
+
     print("\n" + "="*80)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the RAG vector index")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default="simple",
+                        help="simple = JSON vector store, faiss = binary FAISS index")
+    parser.add_argument("--faiss-type", choices=FAISS_INDEX_TYPES, default="flat",
+                        help="FAISS index type (only used with --storage faiss)")
+    parser.add_argument("--index-dir", default=None,
+                        help="Override the output directory")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-embed added/modified files, drop removed ones")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Chunks per embedding forward pass")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Embedding worker processes (CPU threads are split between them)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    main(
+        storage=args.storage,
+        faiss_type=args.faiss_type,
+        index_dir=args.index_dir,
+        incremental=args.incremental,
+        batch_size=args.embed_batch_size,
+        workers=args.workers
+    )
@@ -0,0 +1,173 @@
+# 📁 lazy_models.py
+
+# 👉 On-first-use model loading + startup profile for the front ends (API, CLI, Streamlit)
+
+# Only the standard library here: importing this module must stay instant
+from pathlib import Path
+import threading
+import time
+import os
+
+# Set as early as possible so "process start" timings include imports done before
+PROCESS_START = time.perf_counter()
+
+# Front ends may be started from any directory
+NER_MODEL_PATH = Path(__file__).parent.parent / "models/ner_financial/final"
+
+class StartupProfile:
+    """Named startup phases with their durations (seconds)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phases[name] = seconds
+
+    def mark(self, name):
+        """Record the time since process start (e.g. "app_ready")"""
+        self.record(name, time.perf_counter() - PROCESS_START)
+
+    def to_dict(self):
+        with self._lock:
+            return dict(self.phases)
+
+    def report(self):
+        print("\n⏱️  Startup profile")
+        for name, seconds in self.to_dict().items():
+            print(f"   - {name:28s} {seconds:8.2f}s")
+
+startup_profile = StartupProfile()
+
+def process_memory(pid="self"):
+    """
+    RSS / PSS / private memory of a process in MB (Linux only, {} elsewhere)
+
+    PSS splits shared pages (copy-on-write model weights, mmapped index) between
+    the processes mapping them; private is what the process alone costs.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "shared_mb": round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024, 1),
+        "private_mb": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+class LazyModel:
+    """
+    Build an expensive object on first use (thread-safe, built at most once)
+
+    get() blocks until the object exists. A failed build is retried on the
+    next get(). Use warm_up_in_background() so the first request doesn't pay.
+    """
+
+    def __init__(self, name, factory, profile=startup_profile):
+        self.name = name
+        self._factory = factory
+        self._profile = profile
+        self._lock = threading.Lock()
+        self._value = None
+        self.loading = False
+        self.error = None
+
+    @property
+    def loaded(self):
+        return self._value is not None
+
+    def get(self):
+        if self._value is not None:
+            return self._value
+        with self._lock:
+            if self._value is None:
+                self.loading = True
+                start = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                    self.error = None
+                except Exception as e:
+                    self.error = e
+                    raise
+                finally:
+                    self.loading = False
+                    self._profile.record(f"{self.name}_load", time.perf_counter() - start)
+                self._profile.mark(f"{self.name}_ready")
+        return self._value
+
+    def warm_up(self):
+        """Load, then let the object pay its first-call costs (its own warm_up())"""
+        value = self.get()
+        if hasattr(value, "warm_up"):
+            start = time.perf_counter()
+            value.warm_up()
+            self._profile.record(f"{self.name}_warm_up", time.perf_counter() - start)
+        return value
+
+    def status(self):
+        if self.loaded:
+            return "loaded"
+        if self.loading:
+            return "loading"
+        return "failed" if self.error is not None else "not_loaded"
+
+def warm_up_in_background(models):
+    """
+    Warm models up one after another on a daemon thread
+    (sequential: they share the torch/transformers imports and CPU cores)
+    """
+    def run():
+        for model in models:
+            try:
+                model.warm_up()
+                print(f"🔥 {model.name} warmed up")
+            except Exception as e:
+                print(f"⚠️  {model.name} warm-up failed: {e}")
+        startup_profile.mark("warm_up_done")
+
+    thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+# 🔹 Factories - heavy imports (torch, transformers, llama_index, langchain) happen here
+def load_rag(**kwargs):
+    start = time.perf_counter()
+    from rag_chain import ComplianceRAG
+    startup_profile.record("rag_import", time.perf_counter() - start)
+    rag = ComplianceRAG(**kwargs)
+    for stage, seconds in rag.startup_timings.items():
+        startup_profile.record(f"rag_{stage}", seconds)
+    return rag
+
+def load_ner(**kwargs):
+    start = time.perf_counter()
+    from ner_infer import FinancialNER
+    startup_profile.record("ner_import", time.perf_counter() - start)
+    kwargs.setdefault("model_path", str(NER_MODEL_PATH))
+    kwargs.setdefault("backend", os.getenv("NER_BACKEND", "torch"))
+    if os.getenv("NER_THREADS"):
+        kwargs.setdefault("threads", int(os.getenv("NER_THREADS")))
+    ner = FinancialNER(**kwargs)
+    startup_profile.record("ner_model", ner.load_seconds)
+    return ner
+
+def lazy_rag(**kwargs):
+    return LazyModel("rag", lambda: load_rag(**kwargs))
+
+def lazy_ner(**kwargs):
+    return LazyModel("ner", lambda: load_ner(**kwargs))
+
+def warmup_targets(default="rag,ner"):
+    """Models to warm up in the background, from $MODEL_WARMUP ("" or "none" disables)"""
+    value = os.getenv("MODEL_WARMUP", default).strip().lower()
+    if value in ("", "none", "off"):
+        return []
+    return [name.strip() for name in value.split(",") if name.strip()]
@@ -0,0 +1,543 @@
+# 📁 llm_gateway.py
+
+# 👉 Bounded concurrency + backpressure in front of the Ollama backend
+
+# Ollama queues every request it gets: without a limit here, a burst makes all
+# answers slow and clients time out with no signal. The gateway:
+#   - lets at most max_in_flight generations reach Ollama at once
+#   - makes the others wait in a bounded FIFO queue (full → LLMQueueFull, HTTP 429)
+#   - gives each request a deadline covering queue wait + generation; waiting past it
+#     → LLMQueueTimeout (503), generating past it → LLMDeadlineExceeded (504). The
+#     HTTP request to Ollama is closed, which stops the generation
+#   - talks to Ollama through pooled keep-alive connections
+#
+# With several Ollama hosts ($OLLAMA_HOSTS) an LLMPool puts one gateway in front
+# of each host, routes every generation to the least-loaded healthy one, ejects
+# hosts that fail health checks and retries a failed generation elsewhere.
+#
+# Test it without a GPU against the fake server: python src/fake_ollama.py
+
+from collections import deque
+import threading
+import asyncio
+import time
+import os
+
+import httpx
+
+from metrics import (
+    record_stage, LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_REJECTIONS, LLM_BACKEND_HEALTHY, LLM_RETRIES
+)
+
+# Generations sent to Ollama at once (match OLLAMA_NUM_PARALLEL on the server)
+MAX_IN_FLIGHT = 4
+# Requests allowed to wait for a slot; more are rejected right away
+MAX_QUEUE = 32
+# Seconds a request may take in total: waiting for a slot + generating
+DEADLINE_SECONDS = 120.0
+
+# Several hosts: seconds between health checks, and consecutive failed
+# generations after which a host is ejected until a health check passes
+HEALTH_CHECK_SECONDS = 10.0
+EJECT_AFTER_FAILURES = 2
+
+DEFAULT_OLLAMA_HOST = "http://127.0.0.1:11434"
+
+class LLMUnavailable(Exception):
+    """The LLM did not (or will not) answer in time - status_code is the HTTP status to return"""
+
+    status_code = 503
+    reason = "unavailable"
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LLMQueueFull(LLMUnavailable):
+    status_code = 429
+    reason = "queue_full"
+
+class LLMQueueTimeout(LLMUnavailable):
+    status_code = 503
+    reason = "queue_timeout"
+
+class LLMDeadlineExceeded(LLMUnavailable):
+    status_code = 504
+    reason = "deadline"
+
+def pooled_client_kwargs(max_connections, timeout=DEADLINE_SECONDS):
+    """httpx settings for the Ollama clients: keep-alive pool sized to the in-flight limit"""
+    return {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0
+        ),
+        # Read timeout = the whole deadline: a stuck blocking call still ends
+        "timeout": httpx.Timeout(timeout, connect=5.0),
+    }
+
+class _Waiter:
+    """A queued request; woken by a thread (Event) or an event loop (Future)"""
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+class Admission:
+    """
+    At most max_in_flight holders, at most max_queue waiters (FIFO)
+
+    Shared by threads (CLI, Streamlit) and asyncio tasks (API): a released
+    slot goes straight to the oldest waiter, whichever kind it is.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE, name="llm"):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.name = name
+        self.in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _enter_or_queue(self, waiter):
+        """True if a slot was free; otherwise waiter is queued (or LLMQueueFull)"""
+        with self._lock:
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                return True
+            if len(self._waiters) >= self.max_queue:
+                raise LLMQueueFull(
+                    f"LLM busy: {self.in_flight} generating, {len(self._waiters)} waiting",
+                    retry_after=1
+                )
+            self._waiters.append(waiter)
+            LLM_QUEUE_DEPTH.inc(backend=self.name)
+            return False
+
+    def _abandon(self, waiter):
+        """Leave the queue - True if the slot was handed over meanwhile (caller owns it)"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            LLM_QUEUE_DEPTH.dec(backend=self.name)
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                LLM_QUEUE_DEPTH.dec(backend=self.name)
+                waiter.granted = True  # in_flight unchanged: the slot moves on
+                waiter.wake()
+            else:
+                self.in_flight -= 1
+
+    def acquire(self, timeout):
+        """Block until a slot is free (LLMQueueTimeout after `timeout` seconds)"""
+        waiter = _Waiter()
+        if self._enter_or_queue(waiter):
+            return
+        if not waiter.event.wait(max(0.0, timeout)) and not self._abandon(waiter):
+            raise LLMQueueTimeout(f"No LLM slot free within {timeout:.1f}s", retry_after=1)
+
+    async def aacquire(self, timeout):
+        """acquire() for coroutines - never blocks the event loop"""
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._enter_or_queue(waiter):
+            return
+        try:
+            await asyncio.wait_for(waiter.future, max(0.0, timeout))
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise LLMQueueTimeout(f"No LLM slot free within {timeout:.1f}s", retry_after=1)
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+class LLMGateway:
+    """
+    Drop-in for the ChatOllama calls ComplianceRAG makes (invoke / ainvoke /
+    stream / astream) with admission control and deadlines
+
+    Raises LLMUnavailable subclasses when the request can't be served in time;
+    the backend's own errors pass through unchanged.
+    """
+
+    def __init__(self, llm, max_in_flight=None, max_queue=None, deadline_seconds=None, name="llm",
+                 base_url=None):
+        self.llm = llm
+        self.name = name
+        self.base_url = base_url  # For health checks
+        # Maintained by LLMPool (health checks + failed generations)
+        self.healthy = True
+        self.failures = 0
+        self.deadline_seconds = deadline_seconds or float(os.getenv("LLM_DEADLINE_SECONDS", DEADLINE_SECONDS))
+        self.admission = Admission(
+            max_in_flight=max_in_flight or int(os.getenv("LLM_MAX_IN_FLIGHT", MAX_IN_FLIGHT)),
+            max_queue=max_queue if max_queue is not None else int(os.getenv("LLM_MAX_QUEUE", MAX_QUEUE)),
+            name=name
+        )
+
+    @property
+    def max_in_flight(self):
+        return self.admission.max_in_flight
+
+    def load(self):
+        """Busy-ness relative to capacity - 1.0 means every slot taken"""
+        return (self.admission.in_flight + self.admission.waiting) / self.admission.max_in_flight
+
+    def stats(self):
+        return {
+            "in_flight": self.admission.in_flight,
+            "waiting": self.admission.waiting,
+            "max_in_flight": self.admission.max_in_flight,
+            "max_queue": self.admission.max_queue,
+            "healthy": self.healthy,
+        }
+
+    # 🔹 Admission
+    def _deadline(self, timeout):
+        return time.monotonic() + (timeout or self.deadline_seconds)
+
+    @staticmethod
+    def _remaining(deadline):
+        return deadline - time.monotonic()
+
+    def _rejected(self, error):
+        LLM_REJECTIONS.inc(backend=self.name, reason=error.reason)
+        return error
+
+    def _enter(self, deadline):
+        queued = time.perf_counter()
+        try:
+            self.admission.acquire(self._remaining(deadline))
+        except LLMUnavailable as e:
+            raise self._rejected(e)
+        record_stage("llm", "queue_wait", time.perf_counter() - queued)
+        LLM_IN_FLIGHT.inc(backend=self.name)
+
+    async def _aenter(self, deadline):
+        queued = time.perf_counter()
+        try:
+            await self.admission.aacquire(self._remaining(deadline))
+        except LLMUnavailable as e:
+            raise self._rejected(e)
+        record_stage("llm", "queue_wait", time.perf_counter() - queued)
+        LLM_IN_FLIGHT.inc(backend=self.name)
+
+    def _exit(self):
+        LLM_IN_FLIGHT.dec(backend=self.name)
+        self.admission.release()
+
+    def _deadline_exceeded(self):
+        return self._rejected(LLMDeadlineExceeded("LLM generation exceeded its deadline"))
+
+    # 🔹 Calls
+    def invoke(self, prompt, timeout=None):
+        # Streamed and summed: the deadline is checked between chunks, which a
+        # single blocking call couldn't do (chunk sums merge the token usage too)
+        response = None
+        for chunk in self.stream(prompt, timeout=timeout):
+            response = chunk if response is None else response + chunk
+        return response
+
+    async def ainvoke(self, prompt, timeout=None):
+        deadline = self._deadline(timeout)
+        await self._aenter(deadline)
+        try:
+            # Cancelling closes the HTTP request, which stops the generation in Ollama
+            # (same when the API client disconnects and its task is cancelled)
+            return await asyncio.wait_for(self.llm.ainvoke(prompt), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            raise self._deadline_exceeded()
+        finally:
+            self._exit()
+
+    def stream(self, prompt, timeout=None):
+        deadline = self._deadline(timeout)
+        self._enter(deadline)
+        chunks = self.llm.stream(prompt)
+        try:
+            for chunk in chunks:
+                if self._remaining(deadline) < 0:
+                    raise self._deadline_exceeded()
+                yield chunk
+        except httpx.TimeoutException:
+            raise self._deadline_exceeded()
+        finally:
+            chunks.close()  # closes the HTTP stream when the caller stops early too
+            self._exit()
+
+    async def astream(self, prompt, timeout=None):
+        deadline = self._deadline(timeout)
+        await self._aenter(deadline)
+        chunks = self.llm.astream(prompt).__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self._remaining(deadline))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise self._deadline_exceeded()
+                yield chunk
+        finally:
+            await chunks.aclose()
+            self._exit()
+
+class LLMPool:
+    """
+    Several LLMGateways (one per Ollama host) behind the same four calls
+
+    Routing: least loaded healthy host first (ties rotate). A generation that
+    fails on one host is retried on the next one while its deadline allows;
+    streams are retried only before their first token. Hosts are ejected
+    after EJECT_AFTER_FAILURES failed generations in a row or a failed health
+    check, and come back when a health check passes. A single host is never
+    ejected (nor health-checked).
+    """
+
+    def __init__(self, backends, deadline_seconds=None, health_check_seconds=None):
+        if not backends:
+            raise ValueError("LLMPool needs at least one backend")
+        self.backends = list(backends)
+        self.deadline_seconds = deadline_seconds or float(os.getenv("LLM_DEADLINE_SECONDS", DEADLINE_SECONDS))
+        self.health_check_seconds = health_check_seconds or float(
+            os.getenv("LLM_HEALTH_CHECK_SECONDS", HEALTH_CHECK_SECONDS)
+        )
+        self._lock = threading.Lock()
+        self._turn = 0
+        self._checker = None
+        for backend in self.backends:
+            LLM_BACKEND_HEALTHY.set(1, backend=backend.name)
+
+    @property
+    def max_in_flight(self):
+        return sum(b.max_in_flight for b in self.backends)
+
+    def stats(self):
+        return {
+            "in_flight": sum(b.admission.in_flight for b in self.backends),
+            "waiting": sum(b.admission.waiting for b in self.backends),
+            "max_in_flight": self.max_in_flight,
+            "backends": {b.name: b.stats() for b in self.backends},
+        }
+
+    # 🔹 Routing
+    def _route(self):
+        """Backends to try for one generation, best first (decided lazily)"""
+        self._start_health_checks()
+        with self._lock:
+            self._turn = (self._turn + 1) % len(self.backends)
+            turn = self._turn
+        tried = set()
+        while len(tried) < len(self.backends):
+            left = [i for i in range(len(self.backends)) if i not in tried]
+            # All ejected: still try them rather than fail without asking
+            healthy = [i for i in left if self.backends[i].healthy] or left
+            best = min(healthy, key=lambda i: (self.backends[i].load(), (i - turn) % len(self.backends)))
+            tried.add(best)
+            yield self.backends[best]
+
+    def _succeeded(self, backend):
+        backend.failures = 0
+
+    def _failed(self, backend, error):
+        LLM_RETRIES.inc(backend=backend.name)
+        if isinstance(error, LLMUnavailable):
+            return  # busy, not broken
+        backend.failures += 1
+        # A lone host has no health checker to bring it back - and nowhere else to send traffic
+        if len(self.backends) < 2:
+            return
+        if backend.healthy and backend.failures >= EJECT_AFTER_FAILURES:
+            self._set_health(backend, False, f"{backend.failures} failed generations ({error})")
+
+    def _set_health(self, backend, healthy, reason=""):
+        if backend.healthy == healthy:
+            return
+        backend.healthy = healthy
+        backend.failures = 0
+        LLM_BACKEND_HEALTHY.set(int(healthy), backend=backend.name)
+        if healthy:
+            print(f"✅ LLM backend {backend.name} is back")
+        else:
+            print(f"⚠️  LLM backend {backend.name} ejected: {reason}")
+
+    @staticmethod
+    def _final(error):
+        """Errors no other host can fix: the deadline is spent"""
+        return isinstance(error, (LLMDeadlineExceeded, LLMQueueTimeout))
+
+    @staticmethod
+    def _remaining(deadline):
+        return deadline - time.monotonic()
+
+    # 🔹 Health checks
+    def _start_health_checks(self):
+        """Daemon thread, started on first use (so it runs in every forked worker)"""
+        if len(self.backends) < 2 or self._checker is not None:
+            return
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=self._check_forever, name="llm-health", daemon=True)
+                self._checker.start()
+
+    def _check_forever(self):
+        with httpx.Client(timeout=httpx.Timeout(2.0)) as client:
+            while True:
+                for backend in self.backends:
+                    self.check(backend, client)
+                time.sleep(self.health_check_seconds)
+
+    def check(self, backend, client):
+        try:
+            client.get(f"{backend.base_url}/api/version").raise_for_status()
+        except httpx.HTTPError as e:
+            self._set_health(backend, False, f"health check failed ({e.__class__.__name__})")
+            return False
+        self._set_health(backend, True)
+        return True
+
+    # 🔹 Calls
+    def invoke(self, prompt, timeout=None):
+        deadline = time.monotonic() + (timeout or self.deadline_seconds)
+        error = None
+        for backend in self._route():
+            if self._remaining(deadline) <= 0:
+                break
+            try:
+                response = backend.invoke(prompt, timeout=self._remaining(deadline))
+            except Exception as e:
+                if self._final(e):
+                    raise
+                self._failed(backend, e)
+                error = e
+                continue
+            self._succeeded(backend)
+            return response
+        raise error or LLMDeadlineExceeded("LLM generation exceeded its deadline")
+
+    async def ainvoke(self, prompt, timeout=None):
+        deadline = time.monotonic() + (timeout or self.deadline_seconds)
+        error = None
+        for backend in self._route():
+            if self._remaining(deadline) <= 0:
+                break
+            try:
+                response = await backend.ainvoke(prompt, timeout=self._remaining(deadline))
+            except Exception as e:
+                if self._final(e):
+                    raise
+                self._failed(backend, e)
+                error = e
+                continue
+            self._succeeded(backend)
+            return response
+        raise error or LLMDeadlineExceeded("LLM generation exceeded its deadline")
+
+    def stream(self, prompt, timeout=None):
+        deadline = time.monotonic() + (timeout or self.deadline_seconds)
+        error = None
+        for backend in self._route():
+            if self._remaining(deadline) <= 0:
+                break
+            chunks = backend.stream(prompt, timeout=self._remaining(deadline))
+            started = False
+            try:
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                # Tokens already sent can't be taken back - only retry before the first
+                if started or self._final(e):
+                    raise
+                self._failed(backend, e)
+                error = e
+                continue
+            finally:
+                chunks.close()
+            self._succeeded(backend)
+            return
+        raise error or LLMDeadlineExceeded("LLM generation exceeded its deadline")
+
+    async def astream(self, prompt, timeout=None):
+        deadline = time.monotonic() + (timeout or self.deadline_seconds)
+        error = None
+        for backend in self._route():
+            if self._remaining(deadline) <= 0:
+                break
+            chunks = backend.astream(prompt, timeout=self._remaining(deadline))
+            started = False
+            try:
+                async for chunk in chunks:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if started or self._final(e):
+                    raise
+                self._failed(backend, e)
+                error = e
+                continue
+            finally:
+                await chunks.aclose()
+            self._succeeded(backend)
+            return
+        raise error or LLMDeadlineExceeded("LLM generation exceeded its deadline")
+
+def normalize_host(host):
+    host = host.strip().rstrip("/")
+    return host if "://" in host else f"http://{host}"
+
+def ollama_hosts():
+    """$OLLAMA_HOSTS (comma-separated), else $OLLAMA_HOST, else the local default"""
+    hosts = [h for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()]
+    return [normalize_host(h) for h in hosts or [os.getenv("OLLAMA_HOST", DEFAULT_OLLAMA_HOST)]]
+
+def build_llm(model_name, temperature=0.1, hosts=None, **kwargs):
+    """
+    LLMPool with one pooled-client ChatOllama + LLMGateway per Ollama host
+
+    Limits ($LLM_MAX_IN_FLIGHT, $LLM_MAX_QUEUE) apply per host; the deadline
+    ($LLM_DEADLINE_SECONDS) covers a generation across all its retries.
+    """
+    # Imported here: api.py needs the exceptions above without loading langchain
+    from langchain_ollama import ChatOllama
+
+    gateway_kwargs = {k: kwargs.pop(k) for k in ("max_in_flight", "max_queue", "deadline_seconds") if k in kwargs}
+    max_in_flight = gateway_kwargs.get("max_in_flight") or int(os.getenv("LLM_MAX_IN_FLIGHT", MAX_IN_FLIGHT))
+    deadline = gateway_kwargs.get("deadline_seconds") or float(os.getenv("LLM_DEADLINE_SECONDS", DEADLINE_SECONDS))
+
+    backends = []
+    for host in [normalize_host(h) for h in hosts] if hosts else ollama_hosts():
+        llm = ChatOllama(
+            model=model_name,
+            temperature=temperature,
+            base_url=host,
+            client_kwargs=pooled_client_kwargs(max_in_flight, timeout=deadline),
+            **kwargs
+        )
+        backends.append(LLMGateway(llm, name=host, base_url=host, **gateway_kwargs))
+    return LLMPool(backends, deadline_seconds=deadline)
@@ -0,0 +1,478 @@
+# 📁 metrics.py
+
+# 👉 Prometheus-style metrics + per-request traces for the RAG and NER pipelines
+
+# Standard library only (no prometheus_client): importing this stays instant and
+# the CLI / Streamlit front ends pay nothing for it.
+#
+#   - histograms, counters and gauges rendered in the Prometheus text format (GET /metrics)
+#   - under serve.py each worker also dumps its metrics to $METRICS_DIR and /metrics
+#     adds up every worker (state gauges take the max instead), so a scrape never
+#     sees a single worker only
+#   - a trace per API request (X-Trace-ID header) collects the stage timings of that
+#     request; GET /traces lists the slowest recent ones to show where p99 goes
+
+from collections import deque
+from pathlib import Path
+import contextvars
+import itertools
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+# Seconds - spans a cached answer (~1 ms) up to a slow local LLM (~1 min)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Finished traces kept per process for /traces
+TRACE_HISTORY = 1000
+
+# How often a worker writes its metrics for the others (seconds)
+METRICS_FLUSH_SECONDS = 2.0
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """One metric family: values per label combination"""
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple → value
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    @staticmethod
+    def merge(values, other):
+        """Add another process' snapshot into `values` (in place)"""
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def render(self, values):
+        lines = []
+        for key, value in sorted(values.items()):
+            labels = format_labels(list(zip(self.labels, json.loads(key))))
+            lines.append(f"{self.name}{labels} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """
+    A value that goes up and down
+
+    `aggregate` says how the workers' values combine in /metrics: "sum" for
+    additive gauges (requests in flight, queue depth), "max" / "min" for state
+    gauges where adding up workers means nothing (healthy = 1 in N workers ≠ N).
+    """
+
+    kind = "gauge"
+    AGGREGATES = {"sum": lambda a, b: a + b, "max": max, "min": min}
+
+    def __init__(self, name, help, labels=(), aggregate="sum"):
+        if aggregate not in self.AGGREGATES:
+            raise ValueError(f"Unknown gauge aggregate '{aggregate}'. Choose from {tuple(self.AGGREGATES)}")
+        super().__init__(name, help, labels)
+        self.aggregate = aggregate
+
+    def merge(self, values, other):
+        combine = self.AGGREGATES[self.aggregate]
+        for key, value in other.items():
+            values[key] = combine(values[key], value) if key in values else value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def track(self, **labels):
+        """Context manager: +1 while the block runs (in-flight requests)"""
+        return _Tracked(self, labels)
+
+class _Tracked:
+    def __init__(self, gauge, labels):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(**self.labels)
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.dec(**self.labels)
+        return False
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @staticmethod
+    def _copy(value):
+        return {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+
+    @staticmethod
+    def merge(values, other):
+        for key, state in other.items():
+            if key not in values:
+                values[key] = Histogram._copy(state)
+                continue
+            mine = values[key]
+            mine["counts"] = [a + b for a, b in zip(mine["counts"], state["counts"])]
+            mine["sum"] += state["sum"]
+            mine["count"] += state["count"]
+
+    def render(self, values):
+        lines = []
+        for key, state in sorted(values.items()):
+            labels = list(zip(self.labels, json.loads(key)))
+            # Stored per bucket, exposed cumulatively
+            for bound, total in zip(self.buckets, itertools.accumulate(state["counts"])):
+                lines.append(f"{self.name}_bucket{format_labels(labels + [('le', format_value(bound))])} {total}")
+            lines.append(f"{self.name}_bucket{format_labels(labels + [('le', '+Inf')])} {state['count']}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {state['count']}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), aggregate="sum"):
+        return self._add(Gauge(name, help, labels, aggregate))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, others=()):
+        """Prometheus text format of this process, plus other processes' snapshots"""
+        lines = []
+        for name, metric in self._metrics.items():
+            values = metric.snapshot()
+            for other in others:
+                metric.merge(values, other.get(name, {}))
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# 🔹 Metrics of the pipelines
+STAGE_SECONDS = REGISTRY.histogram(
+    "copilot_stage_seconds",
+    "Seconds per pipeline stage (rag: embedding, retrieval, prompt, generation, first_token, total; "
+    "ner: tokenization, forward; load: first-use model load in the API)",
+    labels=("component", "stage")
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "copilot_http_request_seconds",
+    "API request latency, until the last byte of the response",
+    labels=("method", "route", "status")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "copilot_http_requests_in_flight",
+    "API requests being served",
+    labels=("route",)
+)
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    "copilot_llm_requests_in_flight",
+    "Generations running on the LLM backend",
+    labels=("backend",)
+)
+LLM_QUEUE_DEPTH = REGISTRY.gauge(
+    "copilot_llm_queue_depth",
+    "Generations waiting for an LLM slot",
+    labels=("backend",)
+)
+LLM_BACKEND_HEALTHY = REGISTRY.gauge(
+    "copilot_llm_backend_healthy",
+    "1 while an Ollama host receives traffic (from any worker), 0 while it is ejected",
+    labels=("backend",),
+    aggregate="max"
+)
+LLM_RETRIES = REGISTRY.counter(
+    "copilot_llm_retries_total",
+    "Generations that failed on a host and moved on to the next one",
+    labels=("backend",)
+)
+LLM_REJECTIONS = REGISTRY.counter(
+    "copilot_llm_rejections_total",
+    "Generations refused or cut (queue_full, queue_timeout, deadline)",
+    labels=("backend", "reason")
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "copilot_cache_requests_total",
+    "Cache lookups (answer: hit, semantic_hit, miss; query_embedding: hit, miss)",
+    labels=("cache", "result")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "copilot_llm_tokens_total",
+    "Tokens reported by the LLM",
+    labels=("kind",)
+)
+CONTEXT_TOKENS_SAVED = REGISTRY.counter(
+    "copilot_context_tokens_saved_total",
+    "Prompt tokens removed by context packing (dedup, overlap, budget)"
+)
+RAG_ANSWERS = REGISTRY.counter(
+    "copilot_rag_answers_total",
+    "Answers by outcome (generated, cached, no_documents, failed, rejected)",
+    labels=("outcome",)
+)
+NER_TEXTS = REGISTRY.counter(
+    "copilot_ner_texts_total",
+    "Texts run through the NER model"
+)
+BATCHER_QUEUE_DEPTH = REGISTRY.gauge(
+    "copilot_batcher_queue_depth",
+    "Requests waiting for the next micro-batch",
+    labels=("batcher",)
+)
+BATCH_SIZE = REGISTRY.histogram(
+    "copilot_batch_size",
+    "Requests coalesced into one micro-batch",
+    labels=("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+# 🔹 Traces
+class Trace:
+    """Stage timings of one request"""
+
+    def __init__(self, name, trace_id=None):
+        self.id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.started = time.time()
+        self.stages = {}
+        self.status = None
+        self.total = None
+
+    def add(self, stage, seconds):
+        # Batched NER calls record the same stage several times
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def to_dict(self):
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started": self.started,
+            "status": self.status,
+            "total": self.total,
+            "stages": dict(self.stages),
+        }
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class TraceLog:
+    """The last TRACE_HISTORY finished traces of this process"""
+
+    def __init__(self, size=TRACE_HISTORY):
+        self._traces = deque(maxlen=size)
+        self._lock = threading.Lock()
+        # Requests slower than this are printed ($TRACE_SLOW_SECONDS, off by default)
+        self.slow_seconds = float(os.getenv("TRACE_SLOW_SECONDS", "0"))
+
+    def add(self, trace):
+        with self._lock:
+            self._traces.append(trace)
+        if self.slow_seconds and trace.total is not None and trace.total >= self.slow_seconds:
+            stages = ", ".join(f"{k}={v:.3f}s" for k, v in trace.stages.items())
+            print(f"🐢 {trace.name} took {trace.total:.2f}s (trace {trace.id}): {stages}")
+
+    def slowest(self, limit=20, name=None):
+        with self._lock:
+            traces = [t for t in self._traces if name is None or t.name == name]
+        traces.sort(key=lambda t: t.total or 0.0, reverse=True)
+        return [t.to_dict() for t in traces[:limit]]
+
+    def get(self, trace_id):
+        with self._lock:
+            for trace in self._traces:
+                if trace.id == trace_id:
+                    return trace.to_dict()
+        return None
+
+TRACES = TraceLog()
+
+def record_stage(component, stage, seconds):
+    """Observe a stage duration and attach it to the current request's trace"""
+    STAGE_SECONDS.observe(seconds, component=component, stage=stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(f"{component}.{stage}", seconds)
+
+# 🔹 ASGI middleware (API)
+class MetricsMiddleware:
+    """
+    Per request: a trace (X-Trace-ID in/out), in-flight gauge and latency histogram
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed responses are timed
+    to their last byte and the trace stays current inside the endpoint.
+    """
+
+    def __init__(self, app, skip=("/metrics",)):
+        self.app = app
+        self.skip = set(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(b"x-trace-id")
+        trace = Trace(f"{scope['method']} {scope['path']}", incoming.decode("latin-1") if incoming else None)
+        token = current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace.id.encode("latin-1"))]
+            await send(message)
+
+        # Known paths only - unmatched ones must not create label values
+        app = scope.get("app")
+        known = {getattr(r, "path", None) for r in getattr(app, "routes", ())}
+        in_flight_route = scope["path"] if scope["path"] in known else "unmatched"
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route=in_flight_route)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            HTTP_IN_FLIGHT.dec(route=in_flight_route)
+            # Route template set by the router (e.g. /ask)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            trace.total = time.perf_counter() - start
+            trace.status = status["code"]
+            trace.name = f"{scope['method']} {route}"
+            HTTP_REQUEST_SECONDS.observe(trace.total, method=scope["method"], route=route,
+                                         status=status["code"])
+            TRACES.add(trace)
+            current_trace.reset(token)
+
+# 🔹 Several worker processes (serve.py)
+def metrics_dir():
+    value = os.getenv("METRICS_DIR")
+    return Path(value) if value else None
+
+def write_snapshot(directory=None, registry=REGISTRY):
+    """Dump this process' metrics to <dir>/<pid>.json (atomic rename)"""
+    directory = directory or metrics_dir()
+    if directory is None:
+        return
+    path = Path(directory) / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(registry.snapshot()))
+    os.replace(tmp, path)
+
+def read_snapshots(directory=None):
+    """Snapshots of the other processes sharing $METRICS_DIR"""
+    directory = directory or metrics_dir()
+    if directory is None:
+        return []
+    snapshots = []
+    for path in Path(directory).glob("*.json"):
+        if path.stem == str(os.getpid()):
+            continue
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # Worker exited (or is mid-write) - skip it this scrape
+            continue
+    return snapshots
+
+def start_snapshot_writer(interval=METRICS_FLUSH_SECONDS):
+    """Write snapshots on a daemon thread while $METRICS_DIR is set; None otherwise"""
+    if metrics_dir() is None:
+        return None
+
+    def run():
+        while True:
+            try:
+                write_snapshot()
+            except OSError as e:
+                print(f"⚠️  Could not write metrics snapshot: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-writer", daemon=True)
+    thread.start()
+    return thread
+
+def render_metrics():
+    """Text for GET /metrics: this process + every other worker"""
+    return REGISTRY.render(read_snapshots())
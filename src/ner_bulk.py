@@ -0,0 +1,202 @@
+# 📁 ner_bulk.py
+
+# 👉 Stream large JSONL/CSV files of transaction texts through FinancialNER
+
+from collections import deque
+from pathlib import Path
+import multiprocessing as mp
+import argparse
+import json
+import csv
+import os
+import time
+
+DEFAULT_MODEL_PATH = Path(__file__).parent.parent / "models/ner_financial/final"
+
+# 🔹 Input streaming (one record at a time → bounded memory)
+def iter_records(path, text_field="text", id_field="id"):
+    """Yield (record_id, text) pairs from a .jsonl or .csv file"""
+    path = Path(path)
+
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            for n, row in enumerate(csv.DictReader(f)):
+                yield row.get(id_field, n), row.get(text_field) or ""
+        return
+
+    with open(path, encoding="utf-8") as f:
+        n = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            yield row.get(id_field, n), row.get(text_field) or ""
+            n += 1
+
+def iter_chunks(records, chunk_size, skip=0):
+    """Group records into lists of chunk_size, skipping the first `skip` records"""
+    chunk = []
+    for n, record in enumerate(records):
+        if n < skip:
+            continue
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# 🔹 Checkpointing
+# The checkpoint stores how many records are done and how many bytes of output
+# belong to them, so a crash between the two writes never duplicates rows.
+def checkpoint_path(output_path):
+    return Path(f"{output_path}.ckpt")
+
+def load_checkpoint(output_path):
+    path = checkpoint_path(output_path)
+    if not path.exists():
+        return {"offset": 0, "output_bytes": 0}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(output_path, offset, output_bytes):
+    path = checkpoint_path(output_path)
+    tmp = path.with_suffix(".ckpt.tmp")
+    with open(tmp, "w") as f:
+        json.dump({"offset": offset, "output_bytes": output_bytes}, f)
+    os.replace(tmp, path)
+
+# 🔹 Worker process state
+_ner = None
+_batch_size = 32
+
+def init_worker(model_path, threads, batch_size):
+    """Load the model once per process with pinned torch threads"""
+    global _ner, _batch_size
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    from ner_infer import FinancialNER
+    _ner = FinancialNER(model_path=str(model_path))
+    _batch_size = batch_size
+
+def process_chunk(chunk):
+    texts = [text for _, text in chunk]
+    results = _ner.extract_batch(texts, batch_size=_batch_size)
+    return [
+        {"id": record_id, "entities": entities}
+        for (record_id, _), entities in zip(chunk, results)
+    ]
+
+def run(input_path, output_path, text_field="text", id_field="id",
+        workers=1, threads=1, batch_size=32, chunk_size=512,
+        model_path=DEFAULT_MODEL_PATH, resume=False):
+    """
+    Run NER over every record of input_path and append grouped entities
+    to output_path (JSONL), checkpointing after every chunk
+    """
+    if resume:
+        state = load_checkpoint(output_path)
+        written = Path(output_path).stat().st_size if Path(output_path).exists() else 0
+        if state["output_bytes"] > written:
+            # Checkpoint from another run (or the output was replaced) - truncate() would pad with NULs
+            raise ValueError(
+                f"Checkpoint {checkpoint_path(output_path)} covers {state['output_bytes']} bytes "
+                f"but {output_path} has {written} - start a fresh run without --resume"
+            )
+    else:
+        # A stale checkpoint must not outlive the output it described
+        checkpoint_path(output_path).unlink(missing_ok=True)
+        state = {"offset": 0, "output_bytes": 0}
+    offset = state["offset"]
+
+    if resume and offset:
+        print(f"⏩ Resuming after {offset} records")
+
+    out = open(output_path, "ab" if resume else "wb")
+    # Drop any rows written after the last checkpoint
+    out.truncate(state["output_bytes"])
+    out.seek(state["output_bytes"])
+
+    chunks = iter_chunks(iter_records(input_path, text_field, id_field), chunk_size, skip=offset)
+
+    def write(rows):
+        nonlocal offset
+        for row in rows:
+            out.write((json.dumps(row) + "\n").encode("utf-8"))
+        out.flush()
+        offset += len(rows)
+        save_checkpoint(output_path, offset, out.tell())
+
+    start = time.perf_counter()
+    processed = 0
+
+    if workers <= 1:
+        init_worker(model_path, threads, batch_size)
+        for chunk in chunks:
+            write(process_chunk(chunk))
+            processed += len(chunk)
+            print(f"   ✅ {offset} records done")
+    else:
+        # Keep at most 2 chunks per worker in flight: memory stays bounded,
+        # results are written in input order so the checkpoint stays exact
+        ctx = mp.get_context("spawn")
+        max_pending = workers * 2
+        pending = deque()
+
+        with ctx.Pool(workers, initializer=init_worker,
+                      initargs=(model_path, threads, batch_size)) as pool:
+            for chunk in chunks:
+                pending.append(pool.apply_async(process_chunk, (chunk,)))
+                if len(pending) >= max_pending:
+                    rows = pending.popleft().get()
+                    write(rows)
+                    processed += len(rows)
+                    print(f"   ✅ {offset} records done")
+
+            while pending:
+                rows = pending.popleft().get()
+                write(rows)
+                processed += len(rows)
+                print(f"   ✅ {offset} records done")
+
+    out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"\n✅ Processed {processed} records in {elapsed:.1f}s ({rate:.1f} records/s)")
+    print(f"📁 Output: {output_path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk NER over JSONL/CSV files")
+    parser.add_argument("input", help="Input .jsonl or .csv file")
+    parser.add_argument("output", help="Output .jsonl file (one line per input record)")
+    parser.add_argument("--text-field", default="text", help="Field/column holding the text")
+    parser.add_argument("--id-field", default="id", help="Field/column holding the record id")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per worker")
+    parser.add_argument("--batch-size", type=int, default=32, help="Texts per forward pass")
+    parser.add_argument("--chunk-size", type=int, default=512, help="Records per task/checkpoint")
+    parser.add_argument("--model-path", default=str(DEFAULT_MODEL_PATH))
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    print("="*80)
+    print("Bulk Financial NER")
+    print("="*80)
+    run(
+        args.input,
+        args.output,
+        text_field=args.text_field,
+        id_field=args.id_field,
+        workers=args.workers,
+        threads=args.threads,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        model_path=args.model_path,
+        resume=args.resume
+    )
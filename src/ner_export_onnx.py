@@ -0,0 +1,154 @@
+# 📁 ner_export_onnx.py
+
+# 👉 Export the fine-tuned NER model to ONNX (+ optional int8) and check parity
+
+from transformers import AutoTokenizer, AutoModelForTokenClassification
+from pathlib import Path
+import argparse
+import json
+import time
+import torch
+import numpy as np
+
+from ner_infer import FinancialNER, ONNX_DIR_NAME, ONNX_FILES
+
+MODEL_PATH = "models/ner_financial/final"
+DATA_PATH = "data/ner_train.jsonl"
+
+# 🔹 Export
+def export_onnx(model_path=MODEL_PATH, quantize=False, opset=17):
+    """
+    Write <model_path>/onnx/model.onnx (and model.int8.onnx when quantize=True)
+
+    Batch and sequence length are dynamic so the graph serves any window size.
+    """
+    output_dir = Path(model_path) / ONNX_DIR_NAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"🔧 Loading model from {model_path}...")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForTokenClassification.from_pretrained(model_path)
+    model.eval()
+
+    sample = tokenizer(
+        ["Rahul", "transferred", "money", "to", "HDFC"],
+        is_split_into_words=True,
+        return_tensors="pt"
+    )
+    dynamic = {0: "batch", 1: "sequence"}
+
+    fp32_path = output_dir / ONNX_FILES["onnx"]
+    print(f"📦 Exporting ONNX graph → {fp32_path}")
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        str(fp32_path),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "logits": dynamic},
+        opset_version=opset,
+        dynamo=False
+    )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = output_dir / ONNX_FILES["onnx-int8"]
+        print(f"🗜️  Quantizing (dynamic int8) → {int8_path}")
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+
+    print("✅ Export complete")
+
+# 🔹 Parity + latency check
+def load_sentences(path=DATA_PATH, limit=None):
+    sentences = []
+    with open(path) as f:
+        for line in f:
+            sentences.append(" ".join(json.loads(line)["tokens"]))
+            if limit and len(sentences) >= limit:
+                break
+    return sentences
+
+def time_backend(ner, sentences, batch_size, repeats):
+    ner.extract_batch(sentences[:batch_size], batch_size=batch_size)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        results = ner.extract_batch(sentences, batch_size=batch_size)
+    elapsed = (time.perf_counter() - start) / repeats
+    return results, elapsed
+
+def check_parity(model_path=MODEL_PATH, data_path=DATA_PATH, batch_size=32,
+                 repeats=3, limit=None):
+    """
+    Compare ONNX backends against torch on the training sentences:
+    word-level label agreement, exact entity match and latency
+    """
+    sentences = load_sentences(data_path, limit)
+    print(f"📚 {len(sentences)} sentences from {data_path}")
+
+    backends = ["torch"] + [
+        b for b, name in ONNX_FILES.items()
+        if (Path(model_path) / ONNX_DIR_NAME / name).exists()
+    ]
+
+    reference_labels = None
+    reference_entities = None
+    report = {"num_sentences": len(sentences), "batch_size": batch_size, "backends": {}}
+
+    for backend in backends:
+        ner = FinancialNER(model_path=model_path, backend=backend)
+        entities, elapsed = time_backend(ner, sentences, batch_size, repeats)
+        labels = ner._infer([s.split() for s in sentences], batch_size)
+
+        stats = {
+            "seconds": elapsed,
+            "ms_per_sentence": 1000 * elapsed / len(sentences),
+            "sentences_per_sec": len(sentences) / elapsed,
+        }
+
+        if reference_labels is None:
+            reference_labels, reference_entities = labels, entities
+        else:
+            agree = sum(int((a == b).sum()) for a, b in zip(labels, reference_labels))
+            total = sum(len(a) for a in reference_labels)
+            stats["label_agreement"] = agree / total if total else 1.0
+            stats["entity_exact_match"] = float(np.mean(
+                [a == b for a, b in zip(entities, reference_entities)]
+            ))
+            stats["speedup_vs_torch"] = report["backends"]["torch"]["seconds"] / elapsed
+
+        report["backends"][backend] = stats
+
+    print("\n" + "="*80)
+    print(f"{'Backend':12s} {'ms/sent':>10s} {'sent/s':>10s} {'labels':>10s} {'entities':>10s} {'speedup':>9s}")
+    print("="*80)
+    for backend, stats in report["backends"].items():
+        print(
+            f"{backend:12s} {stats['ms_per_sentence']:10.3f} {stats['sentences_per_sec']:10.1f} "
+            f"{stats.get('label_agreement', 1.0):10.2%} {stats.get('entity_exact_match', 1.0):10.2%} "
+            f"{stats.get('speedup_vs_torch', 1.0):8.2f}x"
+        )
+
+    report_path = Path(model_path) / ONNX_DIR_NAME / "parity_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Report saved to: {report_path}")
+
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the NER model to ONNX")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+    parser.add_argument("--check", action="store_true",
+                        help="Compare ONNX outputs and latency against torch")
+    parser.add_argument("--data", default=DATA_PATH, help="Sentences used by --check")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--limit", type=int, default=None, help="Max sentences for --check")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    export_onnx(args.model_path, quantize=args.quantize)
+    if args.check:
+        check_parity(args.model_path, args.data, batch_size=args.batch_size, limit=args.limit)
@@ -2,118 +2,270 @@
 
 # 👉 Run NER at inference time
 
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoTokenizer, AutoConfig, AutoModelForTokenClassification
+from pathlib import Path
+import numpy as np
 import torch
+import time
+import re
+
+from metrics import record_stage, NER_TEXTS
+
+# Words are whitespace-separated, exactly like text.split(), but keep their offsets
+WORD_PATTERN = re.compile(r"\S+")
+
+# Exported graphs written by ner_export_onnx.py
+ONNX_DIR_NAME = "onnx"
+ONNX_FILES = {
+    "onnx": "model.onnx",
+    "onnx-int8": "model.int8.onnx",
+}
+BACKENDS = ("torch",) + tuple(ONNX_FILES)
 
 class FinancialNER:
-    def __init__(self, model_path="models/ner_financial/final"):
-        print(f"🔧 Loading NER model from {model_path}...")
+    def __init__(self, model_path="models/ner_financial/final", stride=128,
+                 backend="torch", onnx_path=None, threads=None):
+        """
+        Args:
+            model_path: Directory with the fine-tuned model + tokenizer
+            stride: Subword overlap between consecutive windows of long texts
+            backend: torch, onnx (fp32 ONNX Runtime) or onnx-int8 (quantized)
+            onnx_path: Override the .onnx file (default: <model_path>/onnx/...)
+            threads: ONNX Runtime intra-op threads (default: one per core). The
+                     torch backend uses the process-wide torch.set_num_threads()
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown NER backend '{backend}'. Choose from {BACKENDS}")
+
+        start = time.perf_counter()
+        print(f"🔧 Loading NER model from {model_path} ({backend})...")
         # Load trained NER model
+        self.backend = backend
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModelForTokenClassification.from_pretrained(model_path)
-        self.model.eval()
+        self.config = AutoConfig.from_pretrained(model_path)
+
+        if backend == "torch":
+            self.model = AutoModelForTokenClassification.from_pretrained(model_path)
+            self.model.eval()
+        else:
+            import onnxruntime as ort
+
+            onnx_path = onnx_path or Path(model_path) / ONNX_DIR_NAME / ONNX_FILES[backend]
+            if not Path(onnx_path).exists():
+                raise FileNotFoundError(
+                    f"ONNX model not found: {onnx_path}\n"
+                    "Please run: python src/ner_export_onnx.py"
+                    + (" --quantize" if backend == "onnx-int8" else "")
+                )
+            options = ort.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self.session = ort.InferenceSession(
+                str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"]
+            )
+
+        # Texts longer than one window are split into overlapping windows
+        # instead of being truncated
+        self.max_length = min(
+            self.tokenizer.model_max_length,
+            self.config.max_position_embeddings
+        )
+        self.stride = min(stride, self.max_length // 2)
+
+        self._build_label_tables()
+        self.load_seconds = time.perf_counter() - start
         print("✅ NER model loaded successfully")
 
-    def extract(self, text):
-        # Tokenize with proper handling
-        tokens = text.split()
-        inputs = self.tokenizer(
-            tokens,
-            is_split_into_words=True,
-            return_tensors="pt",
-            truncation=True,
-            padding=True
+    def _build_label_tables(self):
+        """Lookup arrays so decoding is NumPy indexing instead of per-token dict lookups"""
+        id2label = self.config.id2label
+        labels = [id2label[i] for i in range(len(id2label))]
+
+        # B-ORG / I-ORG → ORG; "O" → -1
+        self.entity_types = sorted({l.split("-")[-1] for l in labels if l != "O"})
+        type_index = {t: i for i, t in enumerate(self.entity_types)}
+
+        self.label_names = np.array(labels, dtype=object)
+        self.label_type = np.array(
+            [-1 if l == "O" else type_index[l.split("-")[-1]] for l in labels]
         )
+        self.label_is_begin = np.array([l.startswith("B-") for l in labels])
+        self.outside_id = labels.index("O") if "O" in labels else 0
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+    @staticmethod
+    def _split_words(text):
+        """Whitespace tokens + their (start, end) character offsets"""
+        matches = list(WORD_PATTERN.finditer(text))
+        tokens = [m.group() for m in matches]
+        spans = np.array([m.span() for m in matches], dtype=np.int64).reshape(-1, 2)
+        return tokens, spans
 
-        predictions = outputs.logits.argmax(dim=-1)
-        
-        # Get word_ids to properly align predictions with original tokens
-        word_ids = inputs.word_ids()
+    # 🔹 Shared inference core
+    def _infer(self, all_tokens, batch_size=32):
+        """
+        Run the model once over word-split texts
 
-        entities = []
-        previous_word_id = None
-        
-        for idx, word_id in enumerate(word_ids):
-            # Skip special tokens (None) and repeated subword tokens
-            if word_id is None or word_id == previous_word_id:
-                continue
-            
-            pred_id = predictions[0][idx].item()
-            label = self.model.config.id2label[pred_id]
-            
-            if label != "O":
-                entities.append({
-                    "token": tokens[word_id],
-                    "label": label
-                })
-            
-            previous_word_id = word_id
+        Texts longer than the model limit become overlapping windows; every
+        window of the texts in a batch goes through a single forward pass.
+        Where windows overlap, each word keeps the prediction from the window
+        in which it has the most context on both sides.
 
-        return entities
-    
-    def extract_grouped(self, text):
-        """Extract entities and group consecutive tokens of same type"""
-        tokens = text.split()
-        inputs = self.tokenizer(
-            tokens,
-            is_split_into_words=True,
-            return_tensors="pt",
-            truncation=True,
-            padding=True
+        Returns, per text, the label id predicted for the first subword
+        of every word (an int array aligned with the text's words).
+        """
+        results = [np.full(len(tokens), self.outside_id, dtype=np.int64) for tokens in all_tokens]
+        NER_TEXTS.inc(len(all_tokens))
+
+        # Empty texts have nothing to tag; shortest first minimizes padding
+        order = sorted(
+            (i for i, tokens in enumerate(all_tokens) if tokens),
+            key=lambda i: len(all_tokens[i])
         )
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        for start in range(0, len(order), batch_size):
+            batch_ids = order[start:start + batch_size]
+            stage = time.perf_counter()
+            inputs = self.tokenizer(
+                [all_tokens[i] for i in batch_ids],
+                is_split_into_words=True,
+                return_tensors="pt" if self.backend == "torch" else "np",
+                truncation=True,
+                max_length=self.max_length,
+                stride=self.stride,
+                return_overflowing_tokens=True,
+                padding=True  # Pads to the longest window in this batch only
+            )
+            window_owner = np.asarray(inputs.pop("overflow_to_sample_mapping"))
+            record_stage("ner", "tokenization", time.perf_counter() - stage)
 
-        predictions = outputs.logits.argmax(dim=-1)
-        word_ids = inputs.word_ids()
+            stage = time.perf_counter()
+            predictions = self.forward(inputs).argmax(axis=-1)
+            record_stage("ner", "forward", time.perf_counter() - stage)
+            best_context = {i: np.full(len(all_tokens[i]), -1) for i in batch_ids}
 
-        entities = []
-        current_entity = None
-        previous_word_id = None
-        
-        for idx, word_id in enumerate(word_ids):
-            if word_id is None or word_id == previous_word_id:
-                continue
-            
-            pred_id = predictions[0][idx].item()
-            label = self.model.config.id2label[pred_id]
-            
-            if label != "O":
-                # Remove B- or I- prefix to get entity type
-                entity_type = label.split("-")[-1] if "-" in label else label
-                is_begin = label.startswith("B-")
-                
-                # Start new entity if it's a B- tag or type changed
-                if is_begin or current_entity is None or current_entity["type"] != entity_type:
-                    if current_entity:
-                        entities.append(current_entity)
-                    current_entity = {
-                        "text": tokens[word_id],
-                        "type": entity_type,
-                        "tokens": [tokens[word_id]]
-                    }
-                else:
-                    # Continue current entity
-                    current_entity["text"] += " " + tokens[word_id]
-                    current_entity["tokens"].append(tokens[word_id])
-            else:
-                # End current entity when we hit O
-                if current_entity:
-                    entities.append(current_entity)
-                    current_entity = None
-            
-            previous_word_id = word_id
-        
-        # Don't forget the last entity
-        if current_entity:
-            entities.append(current_entity)
+            for row, owner in enumerate(window_owner):
+                i = batch_ids[owner]
+                word_ids = np.array(inputs.word_ids(batch_index=row), dtype=np.float64)
+                positions = np.flatnonzero(self._first_subword_mask(word_ids))
+                words = word_ids[positions].astype(np.int64)
 
+                # Distance to the nearest window edge = context the word had
+                content = np.flatnonzero(~np.isnan(word_ids))
+                context = np.minimum(positions - content[0], content[-1] - positions)
+
+                better = context > best_context[i][words]
+                results[i][words[better]] = predictions[row][positions[better]]
+                best_context[i][words[better]] = context[better]
+
+        return results
+
+    def forward(self, inputs):
+        """Logits as a NumPy array (batch, sequence, labels) for either backend"""
+        if self.backend == "torch":
+            with torch.no_grad():
+                return self.model(**inputs).logits.numpy()
+
+        feed = {
+            i.name: np.asarray(inputs[i.name], dtype=np.int64)
+            for i in self.session.get_inputs()
+        }
+        return self.session.run(["logits"], feed)[0]
+
+    @staticmethod
+    def _first_subword_mask(word_ids):
+        """True at the first subword of each word (special/padding tokens are None)"""
+        word_ids = np.array(word_ids, dtype=np.float64)  # None → nan
+        previous = np.concatenate(([np.nan], word_ids[:-1]))
+        return ~np.isnan(word_ids) & (word_ids != previous)
+
+    # 🔹 Views over one inference result
+    def _flat(self, tokens, label_ids):
+        words = np.flatnonzero(self.label_type[label_ids] >= 0)
+        return [
+            {"token": tokens[w], "label": label}
+            for w, label in zip(words, self.label_names[label_ids[words]])
+        ]
+
+    def _grouped(self, tokens, spans, label_ids):
+        types = self.label_type[label_ids]
+        previous = np.concatenate(([-1], types[:-1]))
+
+        # New entity on a B- tag, or when the type changes (incl. coming out of O)
+        starts = (types >= 0) & (self.label_is_begin[label_ids] | (types != previous))
+        entity_ids = np.cumsum(starts)
+        inside = types >= 0
+
+        entities = []
+        for start in np.flatnonzero(starts):
+            end = start + 1
+            while end < len(types) and inside[end] and entity_ids[end] == entity_ids[start]:
+                end += 1
+            entity_tokens = tokens[start:end]
+            entities.append({
+                "text": " ".join(entity_tokens),
+                "type": self.entity_types[types[start]],
+                "tokens": entity_tokens,
+                "start": int(spans[start][0]),  # Character offsets in the input text
+                "end": int(spans[end - 1][1])
+            })
         return entities
 
+    # 🔹 Public API
+    def analyze(self, text):
+        """Flat and grouped entities from a single forward pass"""
+        return self.analyze_batch([text])[0]
+
+    def analyze_batch(self, texts, batch_size=32):
+        words = [self._split_words(text) for text in texts]
+        label_ids = self._infer([tokens for tokens, _ in words], batch_size)
+        return [
+            {
+                "entities": self._flat(tokens, labels),
+                "grouped": self._grouped(tokens, spans, labels)
+            }
+            for (tokens, spans), labels in zip(words, label_ids)
+        ]
+
+    def extract(self, text):
+        """Individual tagged tokens: [{"token", "label"}]"""
+        tokens = text.split()
+        return self._flat(tokens, self._infer([tokens])[0])
+
+    def warm_up(self):
+        """One tiny forward pass so the first real request skips kernel/graph setup"""
+        self.extract_grouped("Rahul transferred money to HDFC account 1234567890")
+
+    def extract_grouped(self, text):
+        """
+        Extract entities and group consecutive tokens of same type
+
+        Works on texts of any length (long documents are windowed, never
+        truncated); each entity carries start/end character offsets.
+        """
+        tokens, spans = self._split_words(text)
+        return self._grouped(tokens, spans, self._infer([tokens])[0])
+
+    def extract_batch(self, texts, batch_size=32):
+        """
+        Grouped entities for many texts with one forward pass per batch
+
+        Texts are sorted by length so each batch pads to a similar size,
+        then results are returned in the original input order.
+
+        Args:
+            texts: List of raw strings
+            batch_size: Number of texts per forward pass
+
+        Returns:
+            List of entity lists (same format as extract_grouped)
+        """
+        words = [self._split_words(text) for text in texts]
+        label_ids = self._infer([tokens for tokens, _ in words], batch_size)
+        return [
+            self._grouped(tokens, spans, labels)
+            for (tokens, spans), labels in zip(words, label_ids)
+        ]
+
 # Example usage
 if __name__ == "__main__":
     # Initialize NER
@@ -132,14 +284,13 @@ if __name__ == "__main__":
     
     for sentence in test_sentences:
         print(f"\n📝 Sentence: {sentence}")
+        result = ner.analyze(sentence)
         print("\n   Individual entities:")
-        entities = ner.extract(sentence)
-        for entity in entities:
+        for entity in result["entities"]:
             print(f"      • {entity['token']:20s} → {entity['label']}")
         
         print("\n   Grouped entities:")
-        grouped = ner.extract_grouped(sentence)
-        for entity in grouped:
+        for entity in result["grouped"]:
             print(f"      • {entity['text']:25s} → {entity['type']}")
     
     print("\n" + "="*80)
\ No newline at end of file
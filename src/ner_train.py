@@ -3,89 +3,390 @@
 ## 👉 Fine-tunes BERT for Financial NER
 
 # Load and process datasets
-from datasets import Dataset
+from datasets import load_dataset, load_from_disk
 
 # HuggingFace Transformer tools
 from transformers import (
     AutoTokenizer,
     AutoModelForTokenClassification,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
     DataCollatorForTokenClassification  # ← Add this
 )
+from transformers.trainer_pt_utils import LengthGroupedSampler
 
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import hashlib
+import inspect
 import json
+import shutil
+import time
+import os
 
 # 🔹 Model selection
 # DistilBERT is small and fast
 MODEL_NAME = "distilbert-base-cased"
 
+DATA_PATH = "data/ner_train.jsonl"
+
+# Tokenized, label-aligned datasets (Arrow) - one directory per cache key
+CACHE_DIR = "data/cache/ner_train"
+
+MAX_LENGTH = 128
+
+# Bumped when the cached columns change (2: + "length" for length-grouped batching)
+CACHE_FORMAT = 2
+LENGTH_COLUMN = "length"
+
+# Below this many sentences extra tokenizer processes cost more than they save
+NUM_PROC_MIN_ROWS = 10_000
+
+OUTPUT_DIR = "models/ner_financial"
+
+# One JSON line per training run - wall-clock comparisons across profiles
+RUNS_FILE = "train_runs.jsonl"
+
+# 🔹 Training profiles
+# default  = the original settings (batch 8, random order, fp32)
+# fast-cpu = sentences of similar length batched together (little padding),
+#            all cores for intra-op math, collation in background workers,
+#            bf16 autocast when the CPU has native bf16 (AVX512-BF16 / AMX)
+# Flags (--batch-size, --epochs, ...) override single values of a profile
+PROFILES = {
+    "default": {
+        "batch_size": 8,
+        "grad_accum": 1,
+        "epochs": 3,
+        "group_by_length": False,
+        "threads": None,          # None → torch's own default
+        "dataloader_workers": 0,
+        "bf16": "off",
+    },
+    "fast-cpu": {
+        "batch_size": 16,
+        "grad_accum": 1,
+        "epochs": 3,
+        "group_by_length": True,
+        "threads": "auto",        # auto → every core this process may run on
+        "dataloader_workers": 2,
+        "bf16": "auto",           # auto → only with native bf16 support
+    },
+}
+
 # 🔹 Load training data
-def load_data():
-    rows = []
-    with open("/Users/krunaldesai/Desktop/RAG Copilot/data/ner_train.jsonl") as f:
-        for line in f:
-            rows.append(json.loads(line))
-    return rows
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_data(path, cache_dir=CACHE_DIR):
+    """
+    JSONL → Arrow dataset, parsed in chunks and memory-mapped from disk
+
+    Nothing is held as Python objects, so a million-sentence corpus costs
+    no more RAM than a small one.
+    """
+    return load_dataset(
+        "json",
+        data_files=str(path),
+        split="train",
+        cache_dir=str(Path(cache_dir) / "raw")
+    )
+
+def collect_labels(dataset, batch_size=10_000):
+    """Sorted label set, read one column batch at a time"""
+    labels = set()
+    for batch in dataset.select_columns(["labels"]).iter(batch_size=batch_size):
+        for row in batch["labels"]:
+            labels.update(row)
+    return sorted(labels)
+
+def tokenizer_fingerprint(tokenizer):
+    """Identity of the tokenizer: name + vocabulary/normalization rules"""
+    digest = hashlib.sha256(tokenizer.name_or_path.encode("utf-8"))
+    if getattr(tokenizer, "is_fast", False):
+        digest.update(tokenizer.backend_tokenizer.to_str().encode("utf-8"))
+    else:
+        digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def cache_key(data_hash, tokenizer, labels, max_length=MAX_LENGTH):
+    parts = [data_hash, tokenizer_fingerprint(tokenizer), json.dumps(labels), str(max_length),
+             str(CACHE_FORMAT)]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
 
 # 🔹 Tokenization + label alignment
-def tokenize_align(examples, tokenizer, label2id):
+def tokenize_align(examples, tokenizer, label2id, max_length=MAX_LENGTH):
     # Convert words to subword tokens
     tokenized = tokenizer(
         examples["tokens"],
         is_split_into_words=True,
         truncation=True,
         padding=False,  # Don't pad here - let DataCollator handle it
-        max_length=128
+        max_length=max_length
     )
 
     all_labels = []
-    
+
     # Process each example in the batch
     for i in range(len(examples["tokens"])):
         word_ids = tokenized.word_ids(batch_index=i)
         label_ids = []
-        
+
         for word_id in word_ids:
             if word_id is None:
                 label_ids.append(-100)  # Ignored by loss (special tokens)
             else:
                 # Map the label for this word
                 label_ids.append(label2id[examples["labels"][i][word_id]])
-        
+
         all_labels.append(label_ids)
 
     tokenized["labels"] = all_labels
+    # Read by the length-grouped sampler instead of measuring every row at startup
+    tokenized[LENGTH_COLUMN] = [len(ids) for ids in tokenized["input_ids"]]
     return tokenized
 
-# 🔹 Training logic
-def main():
-    print("📚 Loading data...")
-    data = load_data()
-    print(f"   Loaded {len(data)} training examples")
+def prepare_dataset(data_path, tokenizer, cache_dir=CACHE_DIR, num_proc=None, rebuild=False):
+    """
+    Tokenized, label-aligned training set - from the Arrow cache when possible
+
+    The cache key covers the data (sha256 of the file), the tokenizer and the
+    label set, so changing any of them re-tokenizes; sweeps over training
+    hyperparameters reuse the same cache.
+
+    Returns (dataset, labels, data_hash)
+    """
+    cache_dir = Path(cache_dir)
+    start = time.perf_counter()
+    data_hash = file_sha256(data_path)
+
+    # The label scan is per data file - cached next to the datasets
+    labels_file = cache_dir / f"labels-{data_hash[:16]}.json"
+    raw = None
+    if labels_file.exists() and not rebuild:
+        labels = json.loads(labels_file.read_text())
+    else:
+        raw = load_data(data_path, cache_dir)
+        labels = collect_labels(raw)
+        labels_file.parent.mkdir(parents=True, exist_ok=True)
+        labels_file.write_text(json.dumps(labels))
 
-    # Get unique labels
-    labels = sorted({l for row in data for l in row["labels"]})
+    key = cache_key(data_hash, tokenizer, labels)
+    target = cache_dir / key
+    if target.exists() and not rebuild:
+        dataset = load_from_disk(str(target))
+        print(f"♻️  Tokenized dataset from cache {target} ({len(dataset)} examples, "
+              f"{time.perf_counter() - start:.1f}s)")
+        return dataset, labels, data_hash
+
+    if raw is None:
+        raw = load_data(data_path, cache_dir)
+    print(f"   Loaded {len(raw)} training examples")
+
+    if num_proc is None and len(raw) >= NUM_PROC_MIN_ROWS:
+        num_proc = min(os.cpu_count() or 1, 8)
     label2id = {l: i for i, l in enumerate(labels)}
-    id2label = {i: l for l, i in label2id.items()}
-    
-    print(f"🏷️  Found {len(labels)} unique labels: {labels}")
 
-    # Create dataset
-    dataset = Dataset.from_list(data)
+    print(f"⚙️  Tokenizing dataset ({num_proc or 1} process(es))...")
+    dataset = raw.map(
+        tokenize_align,
+        batched=True,
+        num_proc=num_proc,
+        fn_kwargs={"tokenizer": tokenizer, "label2id": label2id},
+        remove_columns=raw.column_names,
+        desc="Tokenizing"
+    )
+
+    # Write to a temporary directory first: an interrupted run leaves no half cache
+    partial = cache_dir / f"{key}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    dataset.save_to_disk(str(partial))
+    (partial / "ner_cache.json").write_text(json.dumps({
+        "data_path": str(data_path),
+        "data_sha256": data_hash,
+        "tokenizer": tokenizer.name_or_path,
+        "labels": labels,
+        "max_length": MAX_LENGTH,
+        "examples": len(dataset),
+    }, indent=2))
+    shutil.rmtree(target, ignore_errors=True)
+    partial.rename(target)
+
+    print(f"💾 Cached tokenized dataset → {target} ({time.perf_counter() - start:.1f}s)")
+    return load_from_disk(str(target)), labels, data_hash
+
+# 🔹 CPU tuning
+def available_cpus():
+    """Cores this process may run on (respects taskset / container cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def bf16_supported():
+    """Native bf16 matmuls - without them autocast emulates bf16 and is slower than fp32"""
+    import torch
+    if torch.cuda.is_available():
+        return torch.cuda.is_bf16_supported()
+    for check in ("_is_amx_tile_supported", "_is_avx512_bf16_supported"):
+        supported = getattr(torch.cpu, check, None)
+        if supported is not None and supported():
+            return True
+    return False
+
+def resolve_settings(profile, **overrides):
+    """Profile values, overridden by the flags that were given, with auto values filled in"""
+    settings = dict(PROFILES[profile])
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+
+    if settings["threads"] == "auto":
+        settings["threads"] = available_cpus()
+    if settings["bf16"] == "auto":
+        settings["bf16"] = bf16_supported()
+    else:
+        settings["bf16"] = settings["bf16"] in (True, "on")
+    return settings
+
+def training_arguments(settings, output_dir, max_steps=-1):
+    """TrainingArguments for a profile - across the transformers versions we meet"""
+    params = inspect.signature(TrainingArguments).parameters
+    kwargs = {
+        "output_dir": output_dir,
+        "per_device_train_batch_size": settings["batch_size"],
+        "gradient_accumulation_steps": settings["grad_accum"],
+        "num_train_epochs": settings["epochs"],
+        "max_steps": max_steps,
+        "learning_rate": 2e-5,
+        "weight_decay": 0.01,
+        "logging_steps": 10,
+        "save_strategy": "epoch",
+        "report_to": "none",
+        "push_to_hub": False,
+        "bf16": settings["bf16"],
+        "dataloader_num_workers": settings["dataloader_workers"],
+    }
+    if settings["bf16"] and "use_cpu" in params:
+        import torch
+        # CPU bf16 autocast has to be asked for explicitly
+        kwargs["use_cpu"] = not torch.cuda.is_available()
+    if settings["dataloader_workers"] and "dataloader_persistent_workers" in params:
+        # Keep the workers between epochs instead of re-forking them
+        kwargs["dataloader_persistent_workers"] = True
+    if settings["group_by_length"]:
+        kwargs["length_column_name"] = LENGTH_COLUMN
+        # transformers 5 replaced the flag with a sampling strategy
+        if "train_sampling_strategy" in params:
+            kwargs["train_sampling_strategy"] = "group_by_length"
+        else:
+            kwargs["group_by_length"] = True
+    return TrainingArguments(**kwargs)
+
+class LengthGroupedTrainer(Trainer):
+    """
+    Trainer whose length-grouped sampler reads the cached length column
+
+    Trainer drops columns forward() does not take (like "length") before it
+    builds the sampler, and LengthGroupedSampler then measures input_ids row
+    by row - a full pass over the dataset at every start. The lengths are
+    taken here, from the unpruned dataset, instead.
+    """
+
+    def __init__(self, *args, lengths=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lengths = lengths
+
+    def _get_train_sampler(self, *args, **kwargs):
+        if self.lengths is None or self.args.world_size > 1:
+            return super()._get_train_sampler(*args, **kwargs)
+        return LengthGroupedSampler(
+            self.args.train_batch_size * self.args.gradient_accumulation_steps,
+            lengths=self.lengths
+        )
+
+class ThroughputCallback(TrainerCallback):
+    """Prints samples/sec for every logging window"""
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.last_time = time.perf_counter()
+        self.last_step = state.global_step
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        now = time.perf_counter()
+        steps = state.global_step - self.last_step
+        if steps <= 0 or not logs or "loss" not in logs:
+            return
+        samples = steps * args.train_batch_size * args.gradient_accumulation_steps * args.world_size
+        print(f"   step {state.global_step}/{state.max_steps}: "
+              f"{samples / (now - self.last_time):.1f} samples/s, loss {logs['loss']:.4f}")
+        self.last_time, self.last_step = now, state.global_step
+
+# 🔹 Run report
+def record_run(run, runs_file):
+    """Append this run and print how it compares with earlier runs on the same data"""
+    runs_file = Path(runs_file)
+    runs_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(runs_file, "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+    runs = []
+    for line in runs_file.read_text().splitlines():
+        try:
+            past = json.loads(line)
+        except ValueError:
+            continue
+        if past.get("data_sha256") == run["data_sha256"]:
+            runs.append(past)
+
+    # Speedup against the most recent run of the original settings
+    baseline = next((r for r in reversed(runs) if r["profile"] == "default"), None)
+
+    print(f"\n⏱️  Training runs on {run['data_path']} ({run['examples']} examples) → {runs_file}")
+    print(f"   {'when':<19} {'profile':<9} {'batch':>7} {'bf16':>5} {'threads':>7} "
+          f"{'train s':>8} {'total s':>8} {'samples/s':>10} {'speedup':>8}")
+    for r in runs[-10:]:
+        speedup = "-"
+        if baseline is not None and baseline["samples_per_second"]:
+            speedup = f"{r['samples_per_second'] / baseline['samples_per_second']:.2f}x"
+        settings = r["settings"]
+        print(f"   {r['finished'][:19]:<19} {r['profile']:<9} "
+              f"{settings['batch_size']:>4}x{settings['grad_accum']:<2} {str(settings['bf16']):>5} "
+              f"{str(settings['threads'] or '-'):>7} {r['train_seconds']:>8.1f} {r['total_seconds']:>8.1f} "
+              f"{r['samples_per_second']:>10.1f} {speedup:>8}")
+
+# 🔹 Training logic
+def main(data_path=DATA_PATH, cache_dir=CACHE_DIR, num_proc=None, rebuild_cache=False,
+         profile="default", output_dir=OUTPUT_DIR, max_steps=-1, **overrides):
+    started = time.perf_counter()
+    settings = resolve_settings(profile, **overrides)
+
+    # Tokenizer processes are forked by datasets - no Rust thread pool across fork()
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    if settings["threads"]:
+        import torch
+        torch.set_num_threads(settings["threads"])
+    print(f"🏎️  Profile {profile}: {settings}")
 
     # Load tokenizer
     print(f"🔧 Loading tokenizer: {MODEL_NAME}")
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    
-    # Tokenize dataset
-    print("⚙️  Tokenizing dataset...")
-    dataset = dataset.map(
-        lambda x: tokenize_align(x, tokenizer, label2id), 
-        batched=True,
-        remove_columns=dataset.column_names
+
+    print(f"📚 Loading data from {data_path}...")
+    dataset, labels, data_hash = prepare_dataset(
+        data_path, tokenizer, cache_dir=cache_dir, num_proc=num_proc, rebuild=rebuild_cache
     )
 
+    label2id = {l: i for i, l in enumerate(labels)}
+    id2label = {i: l for l, i in label2id.items()}
+
+    print(f"🏷️  Found {len(labels)} unique labels: {labels}")
+
     # Load model
     print(f"🤖 Loading model: {MODEL_NAME}")
     model = AutoModelForTokenClassification.from_pretrained(
@@ -102,37 +403,99 @@ def main():
     )
 
     # Training arguments
-    args = TrainingArguments(
-        output_dir="models/ner_financial",
-        per_device_train_batch_size=8,
-        num_train_epochs=3,
-        learning_rate=2e-5,
-        weight_decay=0.01,
-        logging_steps=10,
-        save_strategy="epoch",
-        report_to="none",
-        push_to_hub=False
-    )
+    args = training_arguments(settings, output_dir, max_steps=max_steps)
+
+    # transformers 5 renamed the tokenizer argument
+    tokenizer_arg = "processing_class" if "processing_class" in inspect.signature(Trainer).parameters else "tokenizer"
+
+    lengths = list(dataset[LENGTH_COLUMN])
 
     # Create trainer
-    trainer = Trainer(
+    trainer = LengthGroupedTrainer(
         model=model,
         args=args,
         train_dataset=dataset,
-        tokenizer=tokenizer,
-        data_collator=data_collator  # ← This is critical!
+        data_collator=data_collator,  # ← This is critical!
+        callbacks=[ThroughputCallback()],
+        lengths=lengths if settings["group_by_length"] else None,
+        **{tokenizer_arg: tokenizer}
     )
-    
+
     # Train
     print("\n🚀 Starting training...")
-    trainer.train()
-    
+    result = trainer.train()
+    samples_per_second = result.metrics.get("train_samples_per_second", 0.0)
+    mean_length = sum(lengths) / max(len(lengths), 1)
+    print(f"📈 {samples_per_second:.1f} samples/s, ~{samples_per_second * mean_length:.0f} tokens/s "
+          f"({result.metrics.get('train_runtime', 0.0):.1f}s)")
+
     # Save final model
     print("\n💾 Saving model...")
-    model.save_pretrained("models/ner_financial/final")
-    tokenizer.save_pretrained("models/ner_financial/final")
-    
+    final_dir = Path(output_dir) / "final"
+    model.save_pretrained(final_dir)
+    tokenizer.save_pretrained(final_dir)
+
+    record_run({
+        "finished": datetime.now(timezone.utc).isoformat(),
+        "profile": profile,
+        "settings": settings,
+        "max_steps": max_steps,
+        "data_path": str(data_path),
+        "data_sha256": data_hash,
+        "examples": len(dataset),
+        "train_seconds": round(result.metrics.get("train_runtime", 0.0), 2),
+        "total_seconds": round(time.perf_counter() - started, 2),
+        "samples_per_second": round(samples_per_second, 2),
+        "training_loss": round(result.training_loss, 4),
+    }, Path(output_dir) / RUNS_FILE)
+
     print("✅ Training complete!")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fine-tune DistilBERT for financial NER")
+    parser.add_argument("--data", default=os.getenv("NER_TRAIN_DATA", DATA_PATH),
+                        help="Training JSONL ({tokens, labels} per line; default: $NER_TRAIN_DATA, then data/ner_train.jsonl)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help="Where tokenized datasets are cached (Arrow)")
+    parser.add_argument("--num-proc", type=int, default=None,
+                        help=f"Tokenizer processes (default: up to 8 from {NUM_PROC_MIN_ROWS} sentences)")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                        help="Re-tokenize even if a cached dataset matches")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=os.getenv("NER_TRAIN_PROFILE", "default"),
+                        help="Training profile (default: $NER_TRAIN_PROFILE, then default)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR,
+                        help="Checkpoints, final/ model and the run report")
+    # Profile overrides - unset flags keep the profile's value
+    parser.add_argument("--batch-size", type=int, default=None, help="Per-step batch size")
+    parser.add_argument("--grad-accum", type=int, default=None,
+                        help="Gradient accumulation steps (effective batch = batch size × this)")
+    parser.add_argument("--epochs", type=float, default=None)
+    parser.add_argument("--max-steps", type=int, default=-1,
+                        help="Stop after this many optimizer steps (quick profile comparisons)")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--dataloader-workers", type=int, default=None,
+                        help="Background processes that collate and pad batches")
+    parser.add_argument("--bf16", choices=["auto", "on", "off"], default=None,
+                        help="bf16 autocast (auto: only with native CPU/GPU support)")
+    parser.add_argument("--group-by-length", action=argparse.BooleanOptionalAction, default=None,
+                        help="Batch sentences of similar length together (less padding)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    main(
+        data_path=args.data,
+        cache_dir=args.cache_dir,
+        num_proc=args.num_proc,
+        rebuild_cache=args.rebuild_cache,
+        profile=args.profile,
+        output_dir=args.output_dir,
+        max_steps=args.max_steps,
+        batch_size=args.batch_size,
+        grad_accum=args.grad_accum,
+        epochs=args.epochs,
+        threads=args.threads,
+        dataloader_workers=args.dataloader_workers,
+        bf16=args.bf16,
+        group_by_length=args.group_by_length
+    )
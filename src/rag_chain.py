@@ -2,14 +2,86 @@
 
 # 👉 RAG orchestration (retrieval + LLaMA)
 
-from llama_index.core import load_index_from_storage, StorageContext, Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from langchain_ollama import ChatOllama
+from llama_index.core import load_index_from_storage, QueryBundle
+from llama_index.core.schema import NodeWithScore, TextNode
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
+import contextvars
+import threading
+import asyncio
+import time
 import os
 
+from vector_store import configure_settings, load_storage_context, index_version, index_dir_for
+from sparse_index import SparseIndex, reciprocal_rank_fusion
+from context_builder import ContextBuilder, CONTEXT_TOKEN_BUDGET, MIN_RELATIVE_SCORE
+from answer_cache import AnswerCache, cache_scope
+from metrics import (
+    record_stage, CACHE_REQUESTS, LLM_TOKENS, CONTEXT_TOKENS_SAVED, RAG_ANSWERS
+)
+from llm_gateway import build_llm, LLMUnavailable
+
+NO_DOCUMENTS_MESSAGE = "❌ No documents found in index. The index may be empty."
+
+# Broader search used when the question itself retrieves nothing
+FALLBACK_QUERY = "financial compliance"
+
+# vector → dense only, hybrid → dense + BM25 fused with reciprocal-rank fusion
+RETRIEVAL_MODES = ("vector", "hybrid")
+TOP_K = 3
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = 10
+
+@dataclass
+class RAGAnswer:
+    """Result of one RAG call - front ends reuse these nodes instead of retrieving again"""
+    answer: str
+    nodes: list = field(default_factory=list)    # NodeWithScore, best first
+    timings: dict = field(default_factory=dict)  # seconds per stage + total
+    cached: bool = False                         # served from the answer cache
+    usage: dict = field(default_factory=dict)    # prompt_tokens / output_tokens
+    context: dict = field(default_factory=dict)  # ContextStats: chunks used, tokens saved
+
+def serialize_nodes(docs):
+    """Retrieved nodes as plain dicts (for the cache, SSE events and JSON responses)"""
+    return [
+        {
+            "id": doc.node.node_id,
+            "text": doc.text,
+            "score": doc.score,
+            "metadata": doc.metadata,
+        }
+        for doc in docs
+    ]
+
+def token_usage(message):
+    """Prompt/output token counts reported by Ollama for a message or final chunk"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    meta = getattr(message, "response_metadata", None) or {}
+    counts = {
+        "prompt_tokens": usage.get("input_tokens", meta.get("prompt_eval_count")),
+        "output_tokens": usage.get("output_tokens", meta.get("eval_count")),
+    }
+    return {k: v for k, v in counts.items() if v is not None}
+
 class ComplianceRAG:
-    def __init__(self, model_name="llama3.2"):
+    def __init__(self, model_name="llama3.2", storage=None, index_dir=None,
+                 max_workers=None, cache=True, retrieval=None):
+        """
+        Args:
+            model_name: Ollama model used for generation
+            storage: Index backend - simple (JSON) or faiss (memory-mapped binary).
+                     Defaults to $RAG_STORAGE, then simple
+            index_dir: Override the default index directory for the backend
+            max_workers: Size of the thread pool used for embedding + retrieval
+                         in the async path. Defaults to $RAG_MAX_WORKERS, then 4
+            cache: True for the default AnswerCache (SQLite-backed if $RAG_CACHE_DB
+                   is set), an AnswerCache instance, or False to disable caching
+            retrieval: vector, or hybrid (vector + BM25 with reciprocal-rank fusion).
+                       Defaults to $RAG_RETRIEVAL, then vector
+        """
         # Get project root and change to it
         script_dir = Path(__file__).parent
         project_root = script_dir.parent
@@ -18,44 +90,75 @@ class ComplianceRAG:
         print(f"📁 Working directory: {project_root}")
         
         # CRITICAL: Set embedding model BEFORE loading index
+        # Seconds per construction stage (see startup profile in lazy_models.py)
+        self.startup_timings = {}
+        stage = time.perf_counter()
+
         print("🔧 Initializing embedding model...")
-        embed_model = HuggingFaceEmbedding(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        Settings.embed_model = embed_model
-        Settings.chunk_size = 256
-        Settings.chunk_overlap = 20
+        self.embed_model = configure_settings()
+        self.startup_timings["embedding_model"] = time.perf_counter() - stage
+
+        # LRU of query embeddings
+        self.query_cache_size = int(os.getenv("RAG_QUERY_CACHE_SIZE", "4096"))
+        self._query_embeddings = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.query_cache_stats = {"hits": 0, "misses": 0}
+        # Vector of FALLBACK_QUERY: embedded once (lazily), kept out of the LRU
+        self._fallback_embedding = None
         
         # Load index
+        self.storage = storage or os.getenv("RAG_STORAGE", "simple")
+        stage = time.perf_counter()
         try:
-            print("📂 Loading index from disk...")
-            index_path = Path("indexes/simple_index")
-            
-            if not index_path.exists():
-                raise FileNotFoundError(
-                    f"Index directory not found: {index_path.absolute()}\n"
-                    "Please run: python src/ingest_index.py"
-                )
-            
-            storage_context = StorageContext.from_defaults(
-                persist_dir="indexes/simple_index"
-            )
+            print(f"📂 Loading {self.storage} index from disk...")
+            storage_context = load_storage_context(self.storage, index_dir)
             self.index = load_index_from_storage(storage_context)
-            
-            # Test the index immediately
-            print("🧪 Testing index...")
-            test_retriever = self.index.as_retriever(similarity_top_k=1)
-            test_docs = test_retriever.retrieve("test")
-            print(f"✅ Index loaded - test retrieved {len(test_docs)} docs")
+            print("✅ Index loaded")
             
         except Exception as e:
             print(f"❌ Error loading index: {e}")
             raise
+
+        # Sparse (BM25) index built next to the vector index by ingest_index.py
+        self.retrieval = retrieval or os.getenv("RAG_RETRIEVAL", "vector")
+        if self.retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{self.retrieval}'. Choose from {RETRIEVAL_MODES}")
+        self.sparse_index = None
+        if self.retrieval == "hybrid":
+            self.sparse_index = SparseIndex.load(index_dir_for(self.storage, index_dir))
+            print(f"✅ BM25 index loaded ({len(self.sparse_index)} chunks)")
+        self.startup_timings["index_load"] = time.perf_counter() - stage
         
+        # Answer cache - entries from older index builds are dropped
+        self.model_name = model_name
+        self.index_version = index_version(self.storage, index_dir)
+        if cache is True:
+            cache = AnswerCache(db_path=os.getenv("RAG_CACHE_DB"))
+        self.cache = cache or None
+        if self.cache is not None:
+            self.cache.invalidate(keep_index_version=self.index_version)
+
+        # Token-budgeted, deduplicated prompt context. RRF scores of chunks found
+        # by only one retriever are half those found by both, so no relative
+        # score cutoff in hybrid mode
+        self.context_builder = ContextBuilder(
+            token_budget=int(os.getenv("RAG_CONTEXT_TOKENS", CONTEXT_TOKEN_BUDGET)),
+            min_relative_score=0.0 if self.retrieval == "hybrid" else MIN_RELATIVE_SCORE
+        )
+
+        # Bounded pool for retrieval work coming from async callers
+        max_workers = max_workers or int(os.getenv("RAG_MAX_WORKERS", "4"))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="rag-retrieval"
+        )
+
         # Initialize Ollama
         try:
-            self.llm = ChatOllama(
-                model=model_name,
+            # Pooled Ollama client behind admission control ($LLM_MAX_IN_FLIGHT,
+            # $LLM_MAX_QUEUE, $LLM_DEADLINE_SECONDS)
+            self.llm = build_llm(
+                model_name,
                 temperature=0.1  # Lower temperature for factual answers
             )
             print(f"✅ LLM loaded (model: {model_name})")
@@ -65,55 +168,158 @@ class ComplianceRAG:
             print(f"  ollama pull {model_name}")
             raise
 
-    def answer(self, question, verbose=True, concise=False):
+    def warm_up(self):
         """
-        Answer a question using RAG
-        
-        Args:
-            question: User's question
-            verbose: Whether to print detailed information
-            concise: Whether to generate brief answers (better for BLEU evaluation)
-            
-        Returns:
-            Answer string
+        Pay first-call costs (torch kernels, index pages) before real traffic:
+        embeds the fallback query and runs one retrieval. Optional - nothing
+        depends on it, front ends call it from a background thread.
+        """
+        stage = time.perf_counter()
+        self.retrieve(FALLBACK_QUERY, embedding=self.fallback_embedding())
+        self.startup_timings["warm_up"] = time.perf_counter() - stage
+
+    # 🔹 Query embeddings
+    def embed_query(self, question):
+        """Query embedding, served from the LRU cache for repeated questions"""
+        embedding = self._cached_query_embedding(question)
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(question)
+            self._store_query_embedding(question, embedding)
+        return embedding
+
+    def fallback_embedding(self):
+        """
+        Vector of the broader fallback search, computed on first use
+
+        Not in the query LRU: eviction (or RAG_QUERY_CACHE_SIZE=0) would make
+        every empty retrieval embed it again, and lookups would skew the
+        query-embedding cache stats.
+        """
+        if self._fallback_embedding is None:
+            with self._query_lock:
+                if self._fallback_embedding is None:
+                    self._fallback_embedding = self.embed_model.get_query_embedding(FALLBACK_QUERY)
+        return self._fallback_embedding
+
+    def embed_queries(self, questions):
+        """
+        Embed many questions with one model call (cache misses only)
+        and warm the LRU so answer() on each of them skips embedding
+        """
+        embeddings = [self._cached_query_embedding(q) for q in questions]
+        missing = list(dict.fromkeys(q for q, e in zip(questions, embeddings) if e is None))
+
+        if missing:
+            # all-MiniLM-L6-v2 has no query instruction, so query and
+            # text embeddings are identical and the batch API applies
+            batch = self.embed_model.get_text_embedding_batch(missing)
+            computed = dict(zip(missing, batch))
+            for question, embedding in computed.items():
+                self._store_query_embedding(question, embedding)
+            embeddings = [computed[q] if e is None else e for q, e in zip(questions, embeddings)]
+
+        return embeddings
+
+    def _cached_query_embedding(self, question):
+        with self._query_lock:
+            embedding = self._query_embeddings.get(question)
+            if embedding is None:
+                self.query_cache_stats["misses"] += 1
+                CACHE_REQUESTS.inc(cache="query_embedding", result="miss")
+                return None
+            self._query_embeddings.move_to_end(question)
+            self.query_cache_stats["hits"] += 1
+            CACHE_REQUESTS.inc(cache="query_embedding", result="hit")
+            return embedding
+
+    def _store_query_embedding(self, question, embedding):
+        with self._query_lock:
+            self._query_embeddings[question] = embedding
+            self._query_embeddings.move_to_end(question)
+            while len(self._query_embeddings) > self.query_cache_size:
+                self._query_embeddings.popitem(last=False)
+
+    def retrieve(self, question, verbose=False, embedding=None):
+        """
+        Retrieve the top chunks for a question (with a broader fallback search)
+
+        Pass a precomputed query embedding to skip embedding the question again.
         """
         if verbose:
-         print(f"\n🔍 Query: '{question}'")
-    
-    # Create retriever
-        retriever = self.index.as_retriever(
-        similarity_top_k=3,
-        verbose=verbose
-    )
-    
-    # Retrieve documents
-        docs = retriever.retrieve(question)
-    
+            print(f"\n🔍 Query: '{question}'")
+
+        if embedding is None:
+            embedding = self.embed_query(question)
+
+        # Retrieve documents
+        if self.retrieval == "hybrid":
+            docs = self.hybrid_retrieve(question, embedding, verbose=verbose)
+        else:
+            retriever = self.index.as_retriever(
+                similarity_top_k=TOP_K,
+                verbose=verbose
+            )
+            docs = retriever.retrieve(QueryBundle(query_str=question, embedding=embedding))
+
         if verbose:
             print(f"📚 Retrieved {len(docs)} documents")
-    
+
         if len(docs) == 0:
-        # Try a broader search
+            # Try a broader search
             print("⚠️  No results. Trying broader search...")
             retriever2 = self.index.as_retriever(similarity_top_k=5)
-            docs = retriever2.retrieve("financial compliance")
-        
-            if len(docs) == 0:
-                return "❌ No documents found in index. The index may be empty."
-    
-    # Show retrieved documents
+            docs = retriever2.retrieve(
+                QueryBundle(query_str=FALLBACK_QUERY, embedding=self.fallback_embedding())
+            )
+
+        # Show retrieved documents
         if verbose:
             for i, doc in enumerate(docs[:3]):
                 print(f"\n   📄 Doc {i+1} (relevance: {doc.score:.3f}):")
                 preview = doc.text[:200].replace('\n', ' ')
                 print(f"   {preview}...")
-    
-    # Build context from retrieved docs
-        context = "\n\n---\n\n".join([d.text for d in docs])
-    
-    # Create prompt based on mode
+
+        return docs
+
+    def hybrid_retrieve(self, question, embedding, top_k=TOP_K, verbose=False):
+        """
+        Dense + BM25 candidates fused with reciprocal-rank fusion
+
+        Exact terms (PAN, SSN, section numbers) reach the top through BM25
+        even when the embedding misses them, so a small top_k is enough.
+        Scores on the returned nodes are RRF scores.
+        """
+        retriever = self.index.as_retriever(similarity_top_k=HYBRID_CANDIDATES)
+        dense = retriever.retrieve(QueryBundle(query_str=question, embedding=embedding))
+        sparse = self.sparse_index.search(question, top_k=HYBRID_CANDIDATES)
+
+        fused = reciprocal_rank_fusion([
+            [doc.node.node_id for doc in dense],
+            [node_id for node_id, _ in sparse],
+        ])[:top_k]
+
+        nodes = {doc.node.node_id: doc.node for doc in dense}
+        missing = [node_id for node_id, _ in fused if node_id not in nodes]
+        if missing:
+            nodes.update((node.node_id, node) for node in self.index.docstore.get_nodes(missing))
+
+        if verbose:
+            print(f"🔀 Hybrid: {len(dense)} dense + {len(sparse)} BM25 candidates → {len(fused)}")
+
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused]
+
+    async def aretrieve(self, question, verbose=False):
+        """Run the (CPU-bound) embedding + retrieval on the bounded executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.retrieve, question, verbose
+        )
+
+    def build_prompt(self, question, context, concise=False):
+        """Wrap a context block (see ContextBuilder) in the answer instructions"""
+        # Create prompt based on mode
         if concise:
-            prompt = f"""Answer the question using ONLY the context below. Be brief and concise - list only the key facts without explanations.
+            return f"""Answer the question using ONLY the context below. Be brief and concise - list only the key facts without explanations.
 
 Context:
 {context}
@@ -121,8 +327,8 @@ Context:
 Question: {question}
 
 Brief answer (maximum 2 sentences):"""
-        else:
-            prompt = f"""You are a financial compliance assistant. Answer the question using ONLY the information from the context below.
+
+        return f"""You are a financial compliance assistant. Answer the question using ONLY the information from the context below.
 
 Context:
 {context}
@@ -135,15 +341,318 @@ Instructions:
 - If the context doesn't contain the answer, say so
 
 Answer:"""
-    
-        if verbose:
-            print("\n🤖 Generating answer with LLM...")
-    
+
+    def answer(self, question, verbose=True, concise=False):
+        """
+        Answer a question using RAG
+        
+        Args:
+            question: User's question
+            verbose: Whether to print detailed information
+            concise: Whether to generate brief answers (better for BLEU evaluation)
+            
+        Returns:
+            RAGAnswer with the answer text, the retrieved nodes and stage timings
+        """
+        result, job = self._prepare(question, verbose, concise)
+        if result is not None:
+            return result
+
+        stage = time.perf_counter()
+        try:
+            response = self.llm.invoke(job["prompt"])
+            text, failed = response.content, False
+            job["usage"] = token_usage(response)
+        except LLMUnavailable:
+            # Backpressure is the caller's to handle (HTTP 429/503/504), not an answer
+            self._reject(job, stage)
+            raise
+        except Exception as e:
+            text, failed = f"❌ Error generating response: {e}", True
+        job["timings"]["generation"] = time.perf_counter() - stage
+
+        return self._finish(question, concise, job, text, failed)
+
+    async def aanswer(self, question, verbose=False, concise=False, embedder=None):
+        """
+        Async version of answer() - never blocks the event loop
+
+        Cache lookup, embedding and retrieval run on the bounded executor,
+        generation uses ChatOllama's async client so many questions can be
+        in flight at once.
+
+        embedder: optional `async fn(question) → vector` (e.g. the API's
+        micro-batcher), awaited only when the exact answer cache misses.
+        """
+        result, job = await self._prepare_async(question, verbose, concise, embedder)
+        if result is not None:
+            return result
+
+        stage = time.perf_counter()
+        try:
+            response = await self.llm.ainvoke(job["prompt"])
+            text, failed = response.content, False
+            job["usage"] = token_usage(response)
+        except LLMUnavailable:
+            self._reject(job, stage)
+            raise
+        except Exception as e:
+            text, failed = f"❌ Error generating response: {e}", True
+        job["timings"]["generation"] = time.perf_counter() - stage
+
+        return self._finish(question, concise, job, text, failed)
+
+    # 🔹 Streaming
+    def stream_answer(self, question, verbose=False, concise=False):
+        """
+        Generate the answer token by token
+
+        Yields events (dicts): first {"type": "sources"} with the retrieved
+        chunks, then {"type": "token"} per generated piece of text, then
+        {"type": "done"} with timings (or {"type": "error"}).
+        """
+        result, job = self._prepare(question, verbose, concise)
+        if result is not None:
+            yield from self._result_events(result)
+            return
+
+        yield {"type": "sources", "sources": serialize_nodes(job["docs"])}
+
+        stage = time.perf_counter()
+        parts = []
         try:
-            response = self.llm.invoke(prompt)
-            return response.content
+            for chunk in self.llm.stream(job["prompt"]):
+                if not parts:
+                    job["timings"]["first_token"] = time.perf_counter() - job["start"]
+                parts.append(chunk.content)
+                job.setdefault("usage", {}).update(token_usage(chunk))
+                yield {"type": "token", "content": chunk.content}
+        except LLMUnavailable as e:
+            self._reject(job, stage)
+            yield {"type": "error", "message": f"⏳ {e}", "status": e.status_code}
+            return
         except Exception as e:
-            return f"❌ Error generating response: {e}"
+            job["timings"]["generation"] = time.perf_counter() - stage
+            self._record(job["timings"], "failed")
+            yield {"type": "error", "message": f"❌ Error generating response: {e}"}
+            return
+        job["timings"]["generation"] = time.perf_counter() - stage
+
+        result = self._finish(question, concise, job, "".join(parts), failed=False)
+        yield {
+            "type": "done",
+            "timings": result.timings,
+            "usage": result.usage,
+            "context": result.context,
+            "cached": False
+        }
+
+    async def astream_answer(self, question, verbose=False, concise=False, embedder=None):
+        """Async version of stream_answer() built on ChatOllama.astream (embedder: see aanswer)"""
+        result, job = await self._prepare_async(question, verbose, concise, embedder)
+        if result is not None:
+            for event in self._result_events(result):
+                yield event
+            return
+
+        yield {"type": "sources", "sources": serialize_nodes(job["docs"])}
+
+        stage = time.perf_counter()
+        parts = []
+        try:
+            async for chunk in self.llm.astream(job["prompt"]):
+                if not parts:
+                    job["timings"]["first_token"] = time.perf_counter() - job["start"]
+                parts.append(chunk.content)
+                job.setdefault("usage", {}).update(token_usage(chunk))
+                yield {"type": "token", "content": chunk.content}
+        except LLMUnavailable as e:
+            self._reject(job, stage)
+            yield {"type": "error", "message": f"⏳ {e}", "status": e.status_code}
+            return
+        except Exception as e:
+            job["timings"]["generation"] = time.perf_counter() - stage
+            self._record(job["timings"], "failed")
+            yield {"type": "error", "message": f"❌ Error generating response: {e}"}
+            return
+        job["timings"]["generation"] = time.perf_counter() - stage
+
+        result = self._finish(question, concise, job, "".join(parts), failed=False)
+        yield {
+            "type": "done",
+            "timings": result.timings,
+            "usage": result.usage,
+            "context": result.context,
+            "cached": False
+        }
+
+    @staticmethod
+    def _result_events(result):
+        # Cached / empty-index answers arrive complete - replay them as one token
+        yield {"type": "sources", "sources": serialize_nodes(result.nodes)}
+        yield {"type": "token", "content": result.answer}
+        yield {
+            "type": "done",
+            "timings": result.timings,
+            "usage": result.usage,
+            "context": result.context,
+            "cached": result.cached
+        }
+
+    # 🔹 Shared steps of answer() / aanswer()
+    async def _prepare_async(self, question, verbose, concise, embedder=None):
+        """_prepare() on the executor, keeping the caller's context (request trace)"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        if embedder is None:
+            return await loop.run_in_executor(
+                self.executor, context.run, self._prepare, question, verbose, concise
+            )
+
+        start = time.perf_counter()
+        timings = {}
+        scope = cache_scope(self.model_name, concise, self.index_version, self.retrieval)
+        result = await loop.run_in_executor(
+            self.executor, context.run, self._exact_hit, question, scope, timings, start
+        )
+        if result is not None:
+            return result, None
+
+        stage = time.perf_counter()
+        embedding = await embedder(question)
+        timings["embedding"] = time.perf_counter() - stage
+
+        return await loop.run_in_executor(
+            self.executor, context.run, self._prepare_embedded,
+            question, verbose, concise, scope, embedding, timings, start
+        )
+
+    def _prepare(self, question, verbose, concise):
+        """
+        Everything before generation: cache lookup, embedding, retrieval, prompt
+
+        Returns (result, job) - result is set when no generation is needed
+        (cache hit or empty index), otherwise job carries the prompt.
+        """
+        start = time.perf_counter()
+        timings = {}
+        scope = cache_scope(self.model_name, concise, self.index_version, self.retrieval)
+
+        result = self._exact_hit(question, scope, timings, start)
+        if result is not None:
+            return result, None
+
+        stage = time.perf_counter()
+        embedding = self.embed_query(question)
+        timings["embedding"] = time.perf_counter() - stage
+
+        return self._prepare_embedded(question, verbose, concise, scope, embedding, timings, start)
+
+    def _exact_hit(self, question, scope, timings, start):
+        """Exact cache hit costs no embedding at all"""
+        if self.cache is None:
+            return None
+        entry = self.cache.get(question, scope)
+        if entry is None:
+            return None
+        CACHE_REQUESTS.inc(cache="answer", result="hit")
+        return self._from_cache(entry, timings, start)
+
+    def _prepare_embedded(self, question, verbose, concise, scope, embedding, timings, start):
+        """_prepare() from the query embedding on: semantic cache, retrieval, prompt"""
+        # Near-duplicate question asked before?
+        if self.cache is not None:
+            entry = self.cache.get_similar(question, scope, embedding)
+            if entry is not None:
+                CACHE_REQUESTS.inc(cache="answer", result="semantic_hit")
+                if verbose:
+                    print(f"♻️  Cached answer for: '{entry['question']}'")
+                return self._from_cache(entry, timings, start), None
+            CACHE_REQUESTS.inc(cache="answer", result="miss")
+
+        stage = time.perf_counter()
+        docs = self.retrieve(question, verbose=verbose, embedding=embedding)
+        timings["retrieval"] = time.perf_counter() - stage
+
+        if len(docs) == 0:
+            timings["total"] = time.perf_counter() - start
+            self._record(timings, "no_documents")
+            return RAGAnswer(answer=NO_DOCUMENTS_MESSAGE, nodes=docs, timings=timings), None
+
+        stage = time.perf_counter()
+        context, docs, context_stats = self.context_builder.build(docs)
+        prompt = self.build_prompt(question, context, concise=concise)
+        timings["prompt"] = time.perf_counter() - stage
+
+        if verbose:
+            print(f"✂️  Context: {context_stats.used_chunks}/{context_stats.input_chunks} chunks, "
+                  f"{context_stats.tokens_before} → {context_stats.tokens_after} tokens "
+                  f"(saved {context_stats.tokens_saved})")
+            print("\n🤖 Generating answer with LLM...")
+
+        job = {
+            "start": start,
+            "timings": timings,
+            "docs": docs,
+            "prompt": prompt,
+            "embedding": embedding,
+            "scope": scope,
+            "context": context_stats.to_dict(),
+        }
+        return None, job
+
+    def _finish(self, question, concise, job, text, failed):
+        timings = job["timings"]
+        timings["total"] = time.perf_counter() - job["start"]
+        self._record(timings, "failed" if failed else "generated")
+        usage = job.get("usage", {})
+        for kind in ("prompt_tokens", "output_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.inc(usage[kind], kind=kind.replace("_tokens", ""))
+        CONTEXT_TOKENS_SAVED.inc(job["context"].get("tokens_saved", 0))
+
+        # Never cache errors
+        if self.cache is not None and not failed:
+            self.cache.put(
+                question,
+                job["scope"],
+                text,
+                sources=serialize_nodes(job["docs"]),
+                embedding=job["embedding"]
+            )
+
+        return RAGAnswer(
+            answer=text,
+            nodes=job["docs"],
+            timings=timings,
+            usage=usage,
+            context=job["context"]
+        )
+
+    def _reject(self, job, stage):
+        job["timings"]["generation"] = time.perf_counter() - stage
+        job["timings"]["total"] = time.perf_counter() - job["start"]
+        self._record(job["timings"], "rejected")
+
+    @staticmethod
+    def _record(timings, outcome):
+        """Stage timings → copilot_stage_seconds histograms (+ the request trace)"""
+        for stage, seconds in timings.items():
+            record_stage("rag", stage, seconds)
+        RAG_ANSWERS.inc(outcome=outcome)
+
+    @classmethod
+    def _from_cache(cls, entry, timings, start):
+        nodes = [
+            NodeWithScore(
+                node=TextNode(id_=src["id"], text=src["text"], metadata=src["metadata"]),
+                score=src["score"]
+            )
+            for src in entry["sources"]
+        ]
+        timings["total"] = time.perf_counter() - start
+        cls._record(timings, "cached")
+        return RAGAnswer(answer=entry["answer"], nodes=nodes, timings=timings, cached=True)
 
 # Example usage and testing
 if __name__ == "__main__":
@@ -166,6 +675,7 @@ if __name__ == "__main__":
     
     for q in questions:
         print(f"\n{'='*80}")
-        answer = rag.answer(q, verbose=True)
-        print(f"\n💡 Answer:\n{answer}")
+        result = rag.answer(q, verbose=True)
+        print(f"\n💡 Answer:\n{result.answer}")
+        print(f"⏱️  {result.timings['total']:.2f}s")
         print("="*80)
\ No newline at end of file
@@ -0,0 +1,217 @@
+# 📁 serve.py
+
+# 👉 Multi-worker API server: load models once, then fork uvicorn workers that share them
+
+# Pre-fork model:
+#   - the parent loads the RAG stack and the NER model, freezes the GC and binds the socket
+#   - each forked worker inherits the model weights copy-on-write (pages stay shared
+#     as long as nobody writes them) and accepts connections on the shared socket
+#   - with RAG_STORAGE=faiss the vectors are a memory-mapped file: one copy in the
+#     page cache for every worker, never duplicated
+#   - each worker gets its own slice of the cores for torch / FAISS / ONNX Runtime
+#
+# Usage:
+#   RAG_STORAGE=faiss python src/serve.py --workers 4
+#   curl localhost:8000/health   # "worker" shows pid + RSS/PSS/private MB
+
+from pathlib import Path
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+# Seconds to wait before replacing a worker that died
+RESTART_DELAY = 1.0
+
+# Rust tokenizers start a thread pool on first use - it must not exist at fork()
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+def default_workers():
+    return int(os.getenv("API_WORKERS", os.cpu_count() or 1))
+
+def fork_safe_models():
+    """
+    Models that can be built before fork()
+
+    ONNX Runtime starts its thread pool when the session is created and those
+    threads don't survive fork(), so the onnx NER backends load in each worker.
+    """
+    names = ["rag"]
+    if os.getenv("NER_BACKEND", "torch") == "torch":
+        names.append("ner")
+    return names
+
+def set_threads(threads):
+    """Pin the compute libraries that are already imported to `threads` threads"""
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+    # Read when a model is built in the worker (ONNX Runtime sessions)
+    os.environ["NER_THREADS"] = str(threads)
+
+def preload(api, names):
+    """Build models in the parent, single-threaded (no thread pools before fork)"""
+    import torch
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(1)
+
+    for name in names:
+        start = time.perf_counter()
+        try:
+            api.models[name].get()
+            print(f"📦 {name} preloaded in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # Workers retry on first use (and /health shows the failure)
+            print(f"⚠️  {name} preload failed: {e}")
+
+    rag = api.models["rag"]
+    if rag.loaded and rag.get().storage != "faiss":
+        print("⚠️  RAG_STORAGE is not faiss: the vectors live on the Python heap and each")
+        print("   worker copies the pages it touches. Build and serve the FAISS index:")
+        print("   python src/ingest_index.py --storage faiss && RAG_STORAGE=faiss python src/serve.py")
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(api, sock, index, threads, log_level):
+    """Body of a forked worker - never returns"""
+    import uvicorn
+
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        gc.enable()
+        set_threads(threads)
+
+        # An SQLite connection must not be shared across processes
+        rag = api.models["rag"]
+        if rag.loaded and rag.get().cache is not None:
+            rag.get().cache.reopen()
+
+        print(f"👷 Worker {index} (pid {os.getpid()}) serving with {threads} thread(s)")
+        config = uvicorn.Config(api.app, log_level=log_level, lifespan="on")
+        uvicorn.Server(config).run(sockets=[sock])
+    except Exception as e:
+        print(f"❌ Worker {index} (pid {os.getpid()}) crashed: {e}")
+        code = 1
+    finally:
+        os._exit(code)
+
+def serve(host="0.0.0.0", port=8000, workers=None, threads=None, preload_models=True,
+          log_level="info"):
+    if not hasattr(os, "fork"):
+        raise SystemExit("❌ Multi-worker mode needs fork() - run python src/api.py instead")
+
+    workers = workers or default_workers()
+    threads = threads or int(os.getenv("API_WORKER_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers)
+
+    # No collections while the models are built: objects land in as few pages as possible
+    gc.disable()
+    import api
+
+    if preload_models:
+        preload(api, fork_safe_models())
+
+    # Everything allocated so far moves to the permanent generation: the GC of
+    # each worker never touches (and so never copies) the model pages
+    gc.collect()
+    gc.freeze()
+
+    from lazy_models import process_memory
+    memory = process_memory()
+    if memory:
+        print(f"📦 Parent RSS {memory['rss_mb']:.0f} MB - shared copy-on-write with the workers")
+
+    # Workers dump their metrics here so any of them can serve /metrics for all
+    own_metrics_dir = "METRICS_DIR" not in os.environ
+    if own_metrics_dir:
+        os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="copilot-metrics-")
+    metrics_dir = Path(os.environ["METRICS_DIR"])
+
+    sock = bind_socket(host, port)
+    print(f"🚀 Serving on http://{host}:{port} with {workers} worker(s) x {threads} thread(s)")
+
+    children = {}  # pid → worker index
+
+    def spawn(index):
+        # Unflushed output would be printed again by the child
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            run_worker(api, sock, index, threads, log_level)
+        children[pid] = index
+
+    for index in range(workers):
+        spawn(index)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Supervise: replace workers that die until asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        # Counters of a dead worker restart from zero (Prometheus handles resets)
+        (metrics_dir / f"{pid}.json").unlink(missing_ok=True)
+        if index is None or stopping:
+            continue
+        print(f"⚠️  Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)} - restarting")
+        time.sleep(RESTART_DELAY)
+        if not stopping:
+            spawn(index)
+
+    sock.close()
+    if own_metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    print("👋 All workers stopped")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Multi-worker (pre-fork) API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: $API_WORKERS, then one per core)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Compute threads per worker (default: $API_WORKER_THREADS, then cores / workers)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Let every worker load its own models (no copy-on-write sharing)")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        threads=args.threads,
+        preload_models=not args.no_preload,
+        log_level=args.log_level
+    )
@@ -0,0 +1,140 @@
+# 📁 sparse_index.py
+
+# 👉 BM25 inverted index over the same chunks as the vector index (exact-term matching)
+
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import json
+import math
+import re
+
+# Persisted next to the vector index files
+SPARSE_FILE_NAME = "sparse_index.json"
+
+# Keeps identifiers like "pan", "kyc-2", "4.2.1" or "u/s" as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were what when which who will with".split()
+)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Reciprocal-rank fusion constant (60 is the value from the original RRF paper)
+RRF_K = 60
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked lists of ids: score(id) = sum over lists of 1 / (k + rank)
+
+    Returns [(id, score)] best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+class SparseIndex:
+    """
+    Okapi BM25 over chunk texts
+
+    Postings are kept as NumPy arrays (chunk positions + term frequencies),
+    so a query only touches the postings of its own terms.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.node_ids = []
+        self.doc_lens = np.zeros(0, dtype=np.float32)
+        self.postings = {}  # term → (positions int32, term frequencies float32)
+
+    @classmethod
+    def from_texts(cls, items, k1=BM25_K1, b=BM25_B):
+        """Build from (node_id, text) pairs"""
+        index = cls(k1, b)
+        postings = {}
+        doc_lens = []
+
+        for position, (node_id, text) in enumerate(items):
+            terms = Counter(tokenize(text))
+            index.node_ids.append(node_id)
+            doc_lens.append(sum(terms.values()))
+            for term, tf in terms.items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(position)
+                tfs.append(tf)
+
+        index.doc_lens = np.asarray(doc_lens, dtype=np.float32)
+        index.postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+        return index
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def search(self, query, top_k=10):
+        """Return [(node_id, bm25 score)] best first (only chunks sharing a query term)"""
+        n = len(self.node_ids)
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t in self.postings]
+        if n == 0 or not terms:
+            return []
+
+        avg_len = float(self.doc_lens.mean()) or 1.0
+        scores = np.zeros(n, dtype=np.float32)
+        for term in terms:
+            ids, tfs = self.postings[term]
+            idf = math.log(1.0 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[ids] / avg_len)
+            scores[ids] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k == 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.node_ids[i], float(scores[i])) for i in top]
+
+    # 🔹 Persistence
+    def save(self, index_dir):
+        path = Path(index_dir) / SPARSE_FILE_NAME
+        with open(path, "w") as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "node_ids": self.node_ids,
+                "doc_lens": self.doc_lens.astype(int).tolist(),
+                "postings": {
+                    term: [ids.tolist(), tfs.astype(int).tolist()]
+                    for term, (ids, tfs) in self.postings.items()
+                },
+            }, f)
+        return path
+
+    @classmethod
+    def load(cls, index_dir):
+        path = Path(index_dir) / SPARSE_FILE_NAME
+        if not path.exists():
+            raise FileNotFoundError(
+                f"Sparse index not found: {path.absolute()}\n"
+                f"Please re-run: python src/ingest_index.py"
+            )
+        with open(path) as f:
+            data = json.load(f)
+
+        index = cls(data["k1"], data["b"])
+        index.node_ids = data["node_ids"]
+        index.doc_lens = np.asarray(data["doc_lens"], dtype=np.float32)
+        index.postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (ids, tfs) in data["postings"].items()
+        }
+        return index
@@ -0,0 +1,146 @@
+# 📁 vector_store.py
+
+# 👉 Shared embedding settings + index storage backends (simple JSON / FAISS)
+
+from llama_index.core import StorageContext, Settings
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.vector_stores.faiss import FaissVectorStore
+from pathlib import Path
+import hashlib
+import math
+import faiss
+
+# 🔹 Embedding + chunking settings (must match between ingest and query time)
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+CHUNK_SIZE = 256
+CHUNK_OVERLAP = 20
+
+# Texts per embedding forward pass (llama-index defaults to 10)
+EMBED_BATCH_SIZE = 64
+
+# 🔹 Storage backends
+# simple → llama-index default in-memory store, persisted as JSON
+# faiss  → binary FAISS index file, memory-mapped at load time
+STORAGE_BACKENDS = ("simple", "faiss")
+INDEX_DIRS = {
+    "simple": Path("indexes/simple_index"),
+    "faiss": Path("indexes/faiss_index"),
+}
+
+# llama-index persists the default vector store under this name,
+# for FAISS it is the raw binary written by faiss.write_index
+FAISS_FILE_NAME = "default__vector_store.json"
+
+FAISS_INDEX_TYPES = ("flat", "ivf", "hnsw")
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 8
+
+def configure_settings(embed_batch_size=EMBED_BATCH_SIZE):
+    """Set the global embedding model and chunking used by llama-index"""
+    embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, embed_batch_size=embed_batch_size)
+    Settings.embed_model = embed_model
+    Settings.chunk_size = CHUNK_SIZE
+    Settings.chunk_overlap = CHUNK_OVERLAP
+    return embed_model
+
+def index_dir_for(storage, index_dir=None):
+    if storage not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{storage}'. Choose from {STORAGE_BACKENDS}")
+    return Path(index_dir) if index_dir else INDEX_DIRS[storage]
+
+def create_faiss_index(dim, index_type="flat", num_vectors=None):
+    """
+    Create an empty FAISS index using inner product
+    (MiniLM embeddings are normalized, so scores are cosine similarities)
+
+    Args:
+        dim: Embedding dimension
+        index_type: flat (exact), ivf (inverted lists) or hnsw (graph)
+        num_vectors: Number of vectors that will be added (sizes IVF lists)
+    """
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+
+    if index_type == "ivf":
+        # ~4*sqrt(n) lists is the usual starting point, never more lists than vectors
+        n = max(1, num_vectors or 1)
+        nlist = max(1, min(n, int(4 * math.sqrt(n))))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = min(IVF_NPROBE, nlist)
+        return index
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    raise ValueError(f"Unknown FAISS index type '{index_type}'. Choose from {FAISS_INDEX_TYPES}")
+
+def train_faiss_index(index, vectors):
+    """Train the index if it needs it (IVF); flat and HNSW are no-ops"""
+    if not index.is_trained:
+        index.train(vectors)
+
+def read_faiss_index(path, mmap=True):
+    """Read a FAISS index, memory-mapping the vectors when supported"""
+    path = str(path)
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Some index types can't be mapped - fall back to a regular read
+            pass
+    return faiss.read_index(path)
+
+def load_storage_context(storage="simple", index_dir=None, mmap=True):
+    """
+    Build a StorageContext for a persisted index
+
+    Args:
+        storage: Storage backend (simple or faiss)
+        index_dir: Override the default index directory
+        mmap: Memory-map the FAISS file instead of reading it into RAM
+    """
+    index_dir = index_dir_for(storage, index_dir)
+
+    if not index_dir.exists():
+        raise FileNotFoundError(
+            f"Index directory not found: {index_dir.absolute()}\n"
+            f"Please run: python src/ingest_index.py --storage {storage}"
+        )
+
+    if storage == "faiss":
+        faiss_index = read_faiss_index(index_dir / FAISS_FILE_NAME, mmap=mmap)
+        vector_store = FaissVectorStore(faiss_index=faiss_index)
+        return StorageContext.from_defaults(
+            vector_store=vector_store,
+            persist_dir=str(index_dir)
+        )
+
+    return StorageContext.from_defaults(persist_dir=str(index_dir))
+
+def reconstruct_vectors(faiss_index, positions):
+    """
+    Read stored vectors back out of a FAISS index so unchanged chunks
+    never need to be re-embedded (flat/HNSW store them as-is, IVF needs a direct map)
+    """
+    if hasattr(faiss_index, "nlist"):
+        faiss.extract_index_ivf(faiss_index).make_direct_map()
+    return [faiss_index.reconstruct(int(pos)) for pos in positions]
+
+def index_version(storage="simple", index_dir=None):
+    """
+    Short fingerprint of the persisted index files - changes on every rebuild
+    or incremental update, so caches keyed on it invalidate automatically
+    """
+    index_dir = index_dir_for(storage, index_dir)
+    digest = hashlib.sha256()
+    for path in sorted(index_dir.iterdir()):
+        if path.is_file():
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:12]